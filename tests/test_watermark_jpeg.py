@@ -0,0 +1,193 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from PIL import Image, ImageChops, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import watermark_export
+import watermark_jpeg
+from watermark_export import RenderSettings, export_image
+from watermark_jpeg import JPEGTRAN_NAME, JpegRegionError, find_jpegtran, get_mcu_region, recompress_region
+
+
+def make_jpeg(size, subsampling):
+    """生成带渐变和图形的测试JPEG图片，subsampling 为0（4:4:4）或2（4:2:0）"""
+    width, height = size
+    img = Image.new('RGB', size)
+    img.putdata([((x * 255) // width, (y * 255) // height, ((x + y) * 7) % 256)
+                 for y in range(height) for x in range(width)])
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((20, 15, width - 30, height - 20), outline=(250, 250, 40), width=3)
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=85, subsampling=subsampling)
+    return buffer.getvalue()
+
+
+def make_settings(**changes):
+    settings = dict(
+        text_type='custom', custom_text='2024-05-01', font='Arial', font_size=30, bold=False, italic=False,
+        text_color='black', opacity=0, position='bottom-right', custom_position=None,
+        stroke=False, stroke_width=1, stroke_color='white', shadow=False, shadow_offset=2, shadow_color='black',
+        naming='original', prefix='watermark_', suffix='_watermark',
+        output_format='JPEG', quality=95, encoder_preset='default', lossless_region=True,
+        resize_method='none', target_width=1920, target_height=1080, scale_percent=100,
+    )
+    settings.update(changes)
+    return RenderSettings(**settings)
+
+
+def make_stamp(size):
+    stamp = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(stamp)
+    draw.rectangle((2, 2, size[0] - 3, size[1] - 3), fill=(255, 255, 255, 180))
+    return stamp
+
+
+def decode(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return img.convert('RGB')
+
+
+def crop_coefficients(data, box):
+    """用jpegtran无损裁剪出 box（MCU对齐）范围内的DCT系数，返回裁剪结果的文件内容"""
+    left, top, right, bottom = box
+    result = subprocess.run([find_jpegtran(), '-copy', 'none', '-crop',
+                             f'{right - left}x{bottom - top}+{left}+{top}'],
+                            input=data, stdout=subprocess.PIPE, check=True)
+    return result.stdout
+
+
+def outside_boxes(size, region):
+    """返回区域上下左右四个MCU对齐的矩形（去掉空矩形）"""
+    width, height = size
+    left, top, right, bottom = region
+    boxes = [(0, 0, width, top), (0, bottom, width, height),
+             (0, top, left, bottom), (right, top, width, bottom)]
+    return [box for box in boxes if box[0] < box[2] and box[1] < box[3]]
+
+
+class GetMcuRegionTest(unittest.TestCase):
+
+    def test_expands_to_mcu_boundaries(self):
+        self.assertEqual(get_mcu_region((200, 100), (16, 16), (21, 9, 70, 40)), (16, 0, 80, 48))
+
+    def test_clamps_to_image(self):
+        self.assertEqual(get_mcu_region((200, 100), (8, 8), (-10, 90, 195, 130)), (0, 88, 200, 100))
+
+    def test_outside_image(self):
+        self.assertIsNone(get_mcu_region((200, 100), (8, 8), (210, 10, 260, 40)))
+
+
+def usage_result(usage):
+    return subprocess.CompletedProcess([JPEGTRAN_NAME, '-help'], 1, stdout=usage)
+
+
+class FindJpegtranTest(unittest.TestCase):
+
+    def setUp(self):
+        # 每个测试重新查找jpegtran，结束后恢复模块中缓存的结果
+        for name, value in (('_jpegtran_path', None), ('_jpegtran_checked', False)):
+            patcher = mock.patch.object(watermark_jpeg, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_missing(self):
+        with mock.patch('watermark_jpeg.shutil.which', return_value=None):
+            self.assertIsNone(find_jpegtran())
+
+    def test_without_drop(self):
+        usage = b'usage: jpegtran [switches] [inputfile]\n  -crop WxH+X+Y  Crop to a rectangular region\n'
+        with mock.patch('watermark_jpeg.shutil.which', return_value='/usr/bin/jpegtran'), \
+                mock.patch('watermark_jpeg.subprocess.run', return_value=usage_result(usage)):
+            self.assertIsNone(find_jpegtran())
+
+    def test_with_drop(self):
+        usage = b'usage: jpegtran [switches] [inputfile]\n  -drop +X+Y filename  Drop (insert) another image\n'
+        with mock.patch('watermark_jpeg.shutil.which', return_value='/usr/bin/jpegtran'), \
+                mock.patch('watermark_jpeg.subprocess.run', return_value=usage_result(usage)) as run:
+            self.assertEqual(find_jpegtran(), '/usr/bin/jpegtran')
+            self.assertEqual(find_jpegtran(), '/usr/bin/jpegtran')
+        self.assertEqual(run.call_count, 1)
+
+
+class ExportFallbackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.image_path = os.path.join(self.temp_dir.name, 'photo.jpg')
+        with open(self.image_path, 'wb') as f:
+            f.write(make_jpeg((203, 141), 2))
+
+    def export(self, output_name, settings):
+        output_dir = os.path.join(self.temp_dir.name, output_name)
+        self.assertTrue(export_image(self.image_path, output_dir, settings))
+        with open(os.path.join(output_dir, 'photo.jpeg'), 'rb') as f:
+            return f.read()
+
+    def test_jpegtran_error_falls_back_to_full_encode(self):
+        expected = self.export('full', make_settings(lossless_region=False))
+        with mock.patch.object(watermark_export, 'find_jpegtran', return_value='/usr/bin/jpegtran'), \
+                mock.patch.object(watermark_jpeg, '_run_jpegtran', side_effect=JpegRegionError('不支持 -drop')) as run:
+            output = self.export('region', make_settings())
+        self.assertTrue(run.called)
+        self.assertEqual(output, expected)
+
+    def test_without_jpegtran_falls_back_to_full_encode(self):
+        expected = self.export('full', make_settings(lossless_region=False))
+        with mock.patch.object(watermark_export, 'find_jpegtran', return_value=None), \
+                mock.patch.object(watermark_jpeg, '_run_jpegtran') as run:
+            output = self.export('region', make_settings())
+        self.assertFalse(run.called)
+        self.assertEqual(output, expected)
+
+
+@unittest.skipUnless(find_jpegtran(), f"未安装支持 -drop 的{JPEGTRAN_NAME}")
+class RecompressRegionTest(unittest.TestCase):
+
+    size = (203, 141)
+    stamp_size = (57, 30)
+    position = (61, 45)
+
+    def check_region(self, subsampling, mcu_size, margin):
+        data = make_jpeg(self.size, subsampling)
+        output = recompress_region(data, make_stamp(self.stamp_size), self.position)
+        x, y = self.position
+        region = get_mcu_region(self.size, mcu_size,
+                                (x, y, x + self.stamp_size[0], y + self.stamp_size[1]))
+
+        # 区域以外的DCT系数逐字节相同
+        for box in outside_boxes(self.size, region):
+            self.assertEqual(crop_coefficients(output, box), crop_coefficients(data, box), box)
+
+        # 解码后区域以外的像素相同；色度抽样时解码器的平滑上采样会影响区域边缘外 margin 像素
+        original, result = decode(data), decode(output)
+        self.assertEqual(result.size, original.size)
+        diff = ImageChops.difference(original, result)
+        left, top, right, bottom = region
+        ImageDraw.Draw(diff).rectangle((left - margin, top - margin, right - 1 + margin, bottom - 1 + margin),
+                                       fill=(0, 0, 0))
+        self.assertIsNone(diff.getbbox())
+
+        # 水印已合成到区域内
+        self.assertIsNotNone(ImageChops.difference(original.crop(region), result.crop(region)).getbbox())
+
+    def test_outside_region_unchanged_444(self):
+        self.check_region(0, (8, 8), 0)
+
+    def test_outside_region_unchanged_420(self):
+        self.check_region(2, (16, 16), 1)
+
+    def test_stamp_outside_image(self):
+        data = make_jpeg(self.size, 2)
+        output = recompress_region(data, make_stamp(self.stamp_size), (self.size[0] + 10, 0))
+        self.assertIsNone(ImageChops.difference(decode(data), decode(output)).getbbox())
+
+
+if __name__ == '__main__':
+    unittest.main()
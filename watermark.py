@@ -1,35 +1,19 @@
+import io
 import os
 import sys
 import argparse
-from PIL import Image, ImageDraw, ImageFont
-import exifread
-from datetime import datetime
+import math
+import fnmatch
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from PIL import Image, ImageDraw
 import re
+from watermark_fonts import get_font
+from watermark_index import get_image_metadata, read_source_file, DATE_SOURCE_MTIME
+from watermark_manifest import BatchManifest, settings_digest
 
 
-def get_exif_datetime(image_path):
-    """
-    从图片文件中读取EXIF信息中的拍摄时间
-    """
-    try:
-        with open(image_path, 'rb') as f:
-            tags = exifread.process_file(f)
-            # 尝试获取不同格式的日期时间标签
-            datetime_tags = ['EXIF DateTimeOriginal', 'EXIF DateTimeDigitized', 'Image DateTime']
-            for tag in datetime_tags:
-                if tag in tags:
-                    datetime_str = str(tags[tag])
-                    # 解析日期时间字符串，通常格式为 'YYYY:MM:DD HH:MM:SS'
-                    try:
-                        dt = datetime.strptime(datetime_str, '%Y:%m:%d %H:%M:%S')
-                        return dt.strftime('%Y-%m-%d')  # 返回年月日格式
-                    except ValueError:
-                        continue
-            # 如果没有找到有效的EXIF日期时间，返回None
-            return None
-    except Exception as e:
-        print(f"读取EXIF信息时出错 {image_path}: {e}")
-        return None
+# 支持的图片格式
+IMAGE_EXTENSIONS = frozenset(['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff'])
 
 
 def parse_color(color_str):
@@ -86,32 +70,34 @@ def parse_color(color_str):
     print(f"警告: 无法解析颜色 '{color_str}'，使用默认黑色")
     return (0, 0, 0, 255)
 
-def add_watermark_to_image(image_path, output_dir, font_size=30, text_color='black', bg_color='white', position='bottom-right'):
+def get_output_path(image_path, output_dir):
     """
-    为图片添加水印并保存到输出目录
+    计算带水印图片的输出路径
+    """
+    return os.path.join(output_dir, f"watermarked_{os.path.basename(image_path)}")
+
+
+def add_watermark_to_image(image_path, output_dir, font_size=30, text_color='black', bg_color='white', position='bottom-right', use_index=True,
+                           stat_result=None):
+    """
+    为图片添加水印并保存到输出目录。输入文件只读取一次，stat_result 为已经获取的stat结果（增量处理时）
     """
     try:
-        # 打开图片
-        img = Image.open(image_path)
+        # 读取并打开图片，EXIF日期和修改时间也使用同一份内容和stat结果
+        source = read_source_file(image_path, stat_result)
+        img = Image.open(io.BytesIO(source.data))
         draw = ImageDraw.Draw(img)
         width, height = img.size
 
-        # 获取水印文本（拍摄日期）
-        watermark_text = get_exif_datetime(image_path)
-        if not watermark_text:
+        # 获取水印文本（拍摄日期），文件未变化时直接从元数据索引读取
+        metadata = get_image_metadata(image_path, use_index, source)
+        watermark_text = metadata.date
+        if metadata.date_source == DATE_SOURCE_MTIME:
             # 如果没有EXIF日期信息，使用文件修改时间
-            mtime = os.path.getmtime(image_path)
-            dt = datetime.fromtimestamp(mtime)
-            watermark_text = dt.strftime('%Y-%m-%d')
             print(f"警告: {image_path} 没有EXIF日期信息，使用文件修改时间")
 
-        # 设置水印字体和大小
-        try:
-            # 尝试使用系统字体
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except IOError:
-            # 如果没有找到指定字体，使用默认字体
-            font = ImageFont.load_default()
+        # 设置水印字体和大小（字体对象在进程内缓存，找不到时使用默认字体）
+        font = get_font("arial.ttf", font_size)
 
         # 获取文本大小
         # 对于较新版本的Pillow，使用font.getbbox()获取文本边界
@@ -154,8 +140,7 @@ def add_watermark_to_image(image_path, output_dir, font_size=30, text_color='bla
 
         # 保存图片到输出目录
         os.makedirs(output_dir, exist_ok=True)
-        filename = os.path.basename(image_path)
-        output_path = os.path.join(output_dir, f"watermarked_{filename}")
+        output_path = get_output_path(image_path, output_dir)
         img.save(output_path)
         print(f"已保存带水印的图片到: {output_path}")
         return True
@@ -164,31 +149,237 @@ def add_watermark_to_image(image_path, output_dir, font_size=30, text_color='bla
         return False
 
 
-def process_directory(input_path, font_size=30, text_color='black', bg_color='white', position='bottom-right'):
+def get_cgroup_cpu_limit():
+    """
+    读取cgroup中的CPU配额限制（容器环境），未设置配额时返回None
+    """
+    # cgroup v2: cpu.max 内容为 "<quota> <period>" 或 "max <period>"
+    try:
+        with open('/sys/fs/cgroup/cpu.max', 'r') as f:
+            quota, period = f.read().split()[:2]
+            if quota != 'max' and int(period) > 0:
+                return int(quota) / int(period)
+            return None
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1: cpu.cfs_quota_us 为 -1 表示不限制
+    for cgroup_dir in ('/sys/fs/cgroup/cpu', '/sys/fs/cgroup/cpu,cpuacct'):
+        try:
+            with open(os.path.join(cgroup_dir, 'cpu.cfs_quota_us'), 'r') as f:
+                quota = int(f.read().strip())
+            with open(os.path.join(cgroup_dir, 'cpu.cfs_period_us'), 'r') as f:
+                period = int(f.read().strip())
+            if quota > 0 and period > 0:
+                return quota / period
+            return None
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def get_auto_jobs():
+    """
+    计算自动模式下的并行进程数：取可用CPU核心数与cgroup配额中较小者
+    """
+    try:
+        cpu_count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Windows和macOS不支持sched_getaffinity
+        cpu_count = os.cpu_count() or 1
+
+    cpu_limit = get_cgroup_cpu_limit()
+    if cpu_limit:
+        cpu_count = min(cpu_count, int(math.ceil(cpu_limit)))
+    return max(1, cpu_count)
+
+
+def parse_jobs(value):
+    """
+    解析 --jobs 参数：正整数或 'auto'
+    """
+    if value == 'auto':
+        return get_auto_jobs()
+    try:
+        jobs = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的并行数: {value}（应为正整数或 auto）")
+    if jobs < 1:
+        raise argparse.ArgumentTypeError(f"无效的并行数: {value}（应为正整数或 auto）")
+    return jobs
+
+
+def iter_image_files(root_dir, include=None, exclude=None, max_depth=0, skip_dirs=()):
+    """
+    使用 os.scandir 逐个生成目录中的图片文件路径，边扫描边输出，不预先构建完整列表。
+    include/exclude 为通配符列表，与相对于 root_dir 的路径或文件名匹配；
+    exclude 同样作用于子目录。max_depth 为0时只扫描顶层目录，为None时不限深度。
+    skip_dirs 中的目录（如输出目录）不会被扫描。
+    """
+    skip_dirs = {os.path.normcase(os.path.abspath(d)) for d in skip_dirs}
+
+    def matches(rel_path, name, patterns):
+        return any(fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+    # 深度优先遍历，栈中保存 (目录, 深度)
+    stack = [(root_dir, 0)]
+    while stack:
+        current_dir, depth = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    rel_path = os.path.relpath(entry.path, root_dir).replace(os.sep, '/')
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if ((max_depth is None or depth < max_depth)
+                                    and os.path.normcase(os.path.abspath(entry.path)) not in skip_dirs
+                                    and not (exclude and matches(rel_path, entry.name, exclude))):
+                                subdirs.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    # 只处理支持的图片格式
+                    if os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS:
+                        continue
+                    if include and not matches(rel_path, entry.name, include):
+                        continue
+                    if exclude and matches(rel_path, entry.name, exclude):
+                        continue
+                    yield entry.path
+        except OSError as e:
+            print(f"无法读取目录 {current_dir}: {e}")
+        # 保持子目录按扫描顺序处理
+        stack.extend((subdir, depth + 1) for subdir in reversed(subdirs))
+
+
+def process_images(image_paths, output_dir, font_size=30, text_color='black', bg_color='white', position='bottom-right', jobs=1, use_index=True, incremental=False, input_root=None):
     """
-    处理输入路径，可能是单个文件或目录
+    批量处理图片，jobs大于1时使用进程池并行处理，返回 (成功数, 失败数, 跳过数)
+    image_paths 可以是生成器，图片会在生成的同时被处理。
+    给出 input_root 时，输出目录中会保留图片相对于 input_root 的子目录结构。
+    incremental 为True时，跳过输入文件和设置都没有变化且输出文件存在的图片
+    """
+    success_count = 0
+    fail_count = 0
+    skipped_count = 0
+
+    manifest = None
+    if incremental:
+        manifest = BatchManifest(output_dir)
+        digest = settings_digest({
+            'font_size': font_size,
+            'text_color': text_color,
+            'bg_color': bg_color,
+            'position': position,
+        })
+    # 处理前的输入文件状态，用于写入增量处理清单
+    input_stats = {}
+
+    def image_output_dir(image_path):
+        if input_root is None:
+            return output_dir
+        rel_dir = os.path.relpath(os.path.dirname(image_path), input_root)
+        return output_dir if rel_dir == os.curdir else os.path.join(output_dir, rel_dir)
+
+    def needs_processing(image_path):
+        nonlocal skipped_count
+        if manifest is None:
+            return True
+        try:
+            stat_result = os.stat(image_path)
+        except OSError:
+            # 交给 add_watermark_to_image 报告错误
+            return True
+        if manifest.is_up_to_date(image_path, get_output_path(image_path, image_output_dir(image_path)), digest, stat_result):
+            skipped_count += 1
+            return False
+        input_stats[image_path] = stat_result
+        return True
+
+    def on_result(image_path, success):
+        nonlocal success_count, fail_count
+        if success:
+            success_count += 1
+            if manifest is not None and image_path in input_stats:
+                output_path = get_output_path(image_path, image_output_dir(image_path))
+                manifest.record(image_path, output_path, digest, input_stats.pop(image_path))
+        else:
+            fail_count += 1
+
+    if jobs <= 1:
+        for image_path in image_paths:
+            if needs_processing(image_path):
+                success = add_watermark_to_image(image_path, image_output_dir(image_path), font_size, text_color, bg_color, position, use_index,
+                                                 input_stats.get(image_path))
+                on_result(image_path, success)
+    else:
+        # 预先创建输出目录，避免多个进程同时创建
+        os.makedirs(output_dir, exist_ok=True)
+        # 限制同时提交的任务数，使内存占用不随图片数量增长
+        max_pending = jobs * 4
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            pending = {}
+
+            def collect(futures):
+                for future in futures:
+                    image_path = pending.pop(future)
+                    try:
+                        success = future.result()
+                    except Exception as e:
+                        # 子进程异常退出等情况，add_watermark_to_image 本身无法报告
+                        print(f"处理图片时出错 {image_path}: {e}")
+                        success = False
+                    on_result(image_path, success)
+
+            for image_path in image_paths:
+                if not needs_processing(image_path):
+                    continue
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                future = executor.submit(add_watermark_to_image, image_path, image_output_dir(image_path),
+                                         font_size, text_color, bg_color, position, use_index, input_stats.get(image_path))
+                pending[future] = image_path
+            collect(list(as_completed(pending)))
+
+    if manifest is not None:
+        manifest.compact()
+    return success_count, fail_count, skipped_count
+
+
+def process_directory(input_path, font_size=30, text_color='black', bg_color='white', position='bottom-right', jobs=1, use_index=True, incremental=False,
+                      include=None, exclude=None, max_depth=0):
+    """
+    处理输入路径，可能是单个文件或目录，返回 (成功数, 失败数, 跳过数)
+    处理目录时 max_depth 控制递归深度（0只处理顶层，None不限深度），
+    include/exclude 为文件名通配符
     """
     if not os.path.exists(input_path):
         print(f"错误: 路径不存在 {input_path}")
-        return
+        return 0, 0, 0
 
     # 确定输出目录
+    input_root = None
     if os.path.isfile(input_path):
         parent_dir = os.path.dirname(input_path)
         output_dir = os.path.join(parent_dir, f"{os.path.basename(parent_dir)}_watermark")
-        add_watermark_to_image(input_path, output_dir, font_size, text_color, bg_color, position)
+        image_paths = [input_path]
     else:
-        # 是目录，处理目录下所有图片
+        # 是目录，边扫描边处理目录下的图片，输出目录本身不参与扫描
         output_dir = os.path.join(input_path, f"{os.path.basename(input_path)}_watermark")
-        # 支持的图片格式
-        image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff']
-        
-        # 遍历目录下所有文件
-        for filename in os.listdir(input_path):
-            file_path = os.path.join(input_path, filename)
-            # 只处理文件和支持的图片格式
-            if os.path.isfile(file_path) and any(filename.lower().endswith(ext) for ext in image_extensions):
-                add_watermark_to_image(file_path, output_dir, font_size, text_color, bg_color, position)
+        input_root = input_path
+        image_paths = iter_image_files(input_path, include, exclude, max_depth, skip_dirs=[output_dir])
+
+    success_count, fail_count, skipped_count = process_images(
+        image_paths, output_dir, font_size, text_color, bg_color, position, jobs, use_index, incremental, input_root)
+    if incremental:
+        print(f"处理完成: 成功 {success_count} 张，失败 {fail_count} 张，跳过未变化的图片 {skipped_count} 张")
+    else:
+        print(f"处理完成: 成功 {success_count} 张，失败 {fail_count} 张")
+    return success_count, fail_count, skipped_count
 
 
 if __name__ == "__main__":
@@ -201,7 +392,25 @@ if __name__ == "__main__":
     parser.add_argument('--position', type=str, default='bottom-right', 
                         choices=['top-left', 'top-right', 'bottom-left', 'bottom-right', 'center', 'top', 'bottom', 'left', 'right'],
                         help='水印位置（默认：bottom-right）')
+    parser.add_argument('--jobs', type=parse_jobs, default=1,
+                        help='并行处理的进程数，正整数或 auto（按CPU核心数及容器配额自动选择，默认：1）')
+    parser.add_argument('--no-index', dest='use_index', action='store_false',
+                        help='不使用元数据索引缓存（每次都重新读取EXIF日期）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量处理：跳过输入文件和水印设置都没有变化的图片，中断后再次运行会从中断处继续')
+    parser.add_argument('--recursive', '-r', action='store_true', help='递归处理子目录中的图片（输出目录保留子目录结构）')
+    parser.add_argument('--max-depth', type=int, default=None, help='递归处理的最大子目录深度（0表示只处理顶层目录）')
+    parser.add_argument('--include', action='append', default=None, metavar='PATTERN',
+                        help='只处理匹配通配符的图片（匹配文件名或相对路径，可多次指定）')
+    parser.add_argument('--exclude', action='append', default=None, metavar='PATTERN',
+                        help='跳过匹配通配符的图片或子目录（匹配文件名或相对路径，可多次指定）')
     args = parser.parse_args()
 
+    if args.max_depth is not None:
+        max_depth = args.max_depth
+    else:
+        max_depth = None if args.recursive else 0
+
     # 处理输入路径
-    process_directory(args.image_path, args.font_size, args.text_color, args.bg_color, args.position)
\ No newline at end of file
+    process_directory(args.image_path, args.font_size, args.text_color, args.bg_color, args.position, args.jobs, args.use_index, args.incremental,
+                      args.include, args.exclude, max_depth)
\ No newline at end of file
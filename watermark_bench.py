@@ -0,0 +1,358 @@
+import os
+import io
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import contextlib
+from datetime import datetime
+import PIL
+from PIL import Image
+import watermark
+from watermark_export import RenderSettings, export_image
+
+
+# 默认的合成测试图片目录和结果文件
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'bench_corpus')
+DEFAULT_OUTPUT = 'bench_results.json'
+
+# 默认测试的图片像素数（百万像素），可通过 --sizes 指定到100MP
+DEFAULT_SIZES = [1, 12, 24]
+
+# 测试图片类型：名称 -> (文件扩展名, 是否包含EXIF日期, 是否带透明通道)
+CORPUS_KINDS = {
+    'jpeg-exif': ('.jpg', True, False),
+    'jpeg': ('.jpg', False, False),
+    'png': ('.png', False, False),
+    'png-transparent': ('.png', False, True),
+    'tiff-exif': ('.tif', True, False),
+    'gif': ('.gif', False, False),
+}
+
+# 写入合成图片的固定拍摄日期
+CORPUS_EXIF_DATE = '2024:05:01 10:30:00'
+
+# 生成伪随机纹理时使用的固定种子，保证每次生成的图片相同
+CORPUS_SEED = 20240501
+NOISE_TILE_SIZE = 256
+
+# GUI导出路径（watermark_export.export_image）的测试配置：名称 -> 在默认设置基础上修改的项
+GUI_CONFIGS = {
+    'plain': {},
+    'stroke': {'stroke': True, 'stroke_width': 2},
+    'shadow': {'shadow': True, 'shadow_offset': 3},
+    'stroke-shadow': {'stroke': True, 'stroke_width': 2, 'shadow': True, 'shadow_offset': 3},
+    'resize-width': {'resize_method': 'width', 'target_width': 1920},
+    'resize-height': {'resize_method': 'height', 'target_height': 1080},
+    'resize-percent': {'resize_method': 'percent', 'scale_percent': 50},
+    'png': {'output_format': 'PNG'},
+    'png-fast': {'output_format': 'PNG', 'encoder_preset': 'fast'},
+    'jpeg-small': {'encoder_preset': 'small'},
+    'webp': {'output_format': 'WEBP', 'quality': 80},
+}
+
+# 与GUI默认值一致的水印设置
+GUI_DEFAULT_SETTINGS = {
+    'text_type': 'date',
+    'custom_text': '',
+    'font': 'Arial',
+    'font_size': 30,
+    'bold': False,
+    'italic': False,
+    'text_color': 'black',
+    'opacity': 0,
+    'position': 'bottom-right',
+    'custom_position': None,
+    'stroke': False,
+    'stroke_width': 1,
+    'stroke_color': 'white',
+    'shadow': False,
+    'shadow_offset': 2,
+    'shadow_color': 'black',
+    'naming': 'original',
+    'prefix': 'watermark_',
+    'suffix': '_watermark',
+    'output_format': 'JPEG',
+    'quality': 95,
+    'encoder_preset': 'default',
+    'lossless_region': False,
+    'resize_method': 'none',
+    'target_width': 1920,
+    'target_height': 1080,
+    'scale_percent': 100,
+}
+
+# 命令行版本的测试配置：名称 -> add_watermark_to_image 的参数
+CLI_CONFIGS = {
+    'default': {},
+    'center': {'position': 'center', 'font_size': 60},
+}
+
+
+def image_size_for_megapixels(megapixels):
+    """
+    按3:2的宽高比计算指定像素数的图片尺寸
+    """
+    width = round(math.sqrt(megapixels * 1000000 * 1.5))
+    return width, round(width / 1.5)
+
+
+def _noise_tile():
+    rng = random.Random(CORPUS_SEED)
+    data = bytes(rng.getrandbits(8) for _ in range(NOISE_TILE_SIZE * NOISE_TILE_SIZE * 3))
+    return Image.frombytes('RGB', (NOISE_TILE_SIZE, NOISE_TILE_SIZE), data)
+
+
+def make_synthetic_image(size, transparent=False):
+    """
+    生成内容固定的合成图片：渐变背景叠加平铺的伪随机纹理，
+    使JPEG等格式的编解码开销接近真实照片
+    """
+    width, height = size
+    gradient = Image.linear_gradient('L')
+    red = gradient.resize(size)
+    green = gradient.rotate(90).resize(size)
+    blue = Image.effect_mandelbrot((256, 256), (-2.0, -1.3, 1.0, 1.3), 64).resize(size)
+    img = Image.merge('RGB', (red, green, blue))
+
+    tile = _noise_tile()
+    noise = Image.new('RGB', size)
+    for top in range(0, height, NOISE_TILE_SIZE):
+        for left in range(0, width, NOISE_TILE_SIZE):
+            noise.paste(tile, (left, top))
+    img = Image.blend(img, noise, 0.25)
+
+    if transparent:
+        # 中间不透明、四周逐渐透明，类似抠图后的透明底图片
+        alpha = Image.radial_gradient('L').point(lambda v: 255 - v).resize(size)
+        img.putalpha(alpha)
+    return img
+
+
+def _exif_bytes():
+    exif = Image.Exif()
+    exif[0x0132] = CORPUS_EXIF_DATE
+    exif.get_ifd(0x8769)[0x9003] = CORPUS_EXIF_DATE
+    return exif.tobytes()
+
+
+def corpus_file_name(kind, megapixels):
+    return f"{kind}-{megapixels}mp{CORPUS_KINDS[kind][0]}"
+
+
+def build_corpus(corpus_dir, sizes, kinds):
+    """
+    生成合成测试图片，已存在的文件直接复用。返回测试图片信息列表
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    corpus = []
+    for megapixels in sizes:
+        size = image_size_for_megapixels(megapixels)
+        base = None
+        for kind in kinds:
+            _, has_exif, transparent = CORPUS_KINDS[kind]
+            path = os.path.join(corpus_dir, corpus_file_name(kind, megapixels))
+            if not os.path.exists(path):
+                print(f"生成测试图片: {path} ({size[0]}x{size[1]})")
+                if transparent:
+                    img = make_synthetic_image(size, transparent=True)
+                else:
+                    if base is None:
+                        base = make_synthetic_image(size)
+                    img = base
+                tmp_path = path + '.tmp'
+                if kind.startswith('jpeg'):
+                    save_args = {'format': 'JPEG', 'quality': 90}
+                    if has_exif:
+                        save_args['exif'] = _exif_bytes()
+                elif kind.startswith('png'):
+                    save_args = {'format': 'PNG'}
+                elif kind.startswith('tiff'):
+                    save_args = {'format': 'TIFF', 'tiffinfo': {0x0132: CORPUS_EXIF_DATE}}
+                else:
+                    img = img.convert('P', palette=Image.ADAPTIVE)
+                    save_args = {'format': 'GIF'}
+                img.save(tmp_path, **save_args)
+                os.replace(tmp_path, path)
+            corpus.append({
+                'image': os.path.basename(path),
+                'path': path,
+                'kind': kind,
+                'megapixels': megapixels,
+                'width': size[0],
+                'height': size[1],
+                'exif': has_exif,
+                'transparent': transparent,
+            })
+    return corpus
+
+
+def make_gui_runner(config):
+    settings = RenderSettings(**dict(GUI_DEFAULT_SETTINGS, **GUI_CONFIGS[config]))
+
+    def run(image_path, output_dir):
+        return export_image(image_path, output_dir, settings)
+    return run
+
+
+def make_cli_runner(config):
+    options = CLI_CONFIGS[config]
+
+    def run(image_path, output_dir):
+        return watermark.add_watermark_to_image(image_path, output_dir, **options)
+    return run
+
+
+def time_case(run, image_path, output_dir, repeat):
+    """
+    预热一次（字体解析、元数据索引）后重复执行，返回每次耗时（秒）和是否全部成功。
+    引擎自身的日志输出不计入结果。
+    """
+    times = []
+    ok = True
+    with contextlib.redirect_stdout(io.StringIO()):
+        ok = run(image_path, output_dir) and ok
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ok = run(image_path, output_dir) and ok
+            times.append(time.perf_counter() - start)
+    return times, bool(ok)
+
+
+def get_git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def run_benchmarks(corpus, engines, gui_configs, cli_configs, output_dir, repeat):
+    results = []
+    cases = []
+    for item in corpus:
+        if 'cli' in engines:
+            for config in cli_configs:
+                cases.append(('cli', config, make_cli_runner(config), item))
+        if 'gui' in engines:
+            for config in gui_configs:
+                cases.append(('gui', config, make_gui_runner(config), item))
+
+    for index, (engine, config, run, item) in enumerate(cases, 1):
+        case_output_dir = os.path.join(output_dir, engine, config)
+        times, ok = time_case(run, item['path'], case_output_dir, repeat)
+        median = statistics.median(times)
+        result = {
+            'engine': engine,
+            'config': config,
+            'image': item['image'],
+            'kind': item['kind'],
+            'megapixels': item['megapixels'],
+            'width': item['width'],
+            'height': item['height'],
+            'exif': item['exif'],
+            'transparent': item['transparent'],
+            'ok': ok,
+            'times': [round(t, 6) for t in times],
+            'min': round(min(times), 6),
+            'median': round(median, 6),
+            'mean': round(statistics.mean(times), 6),
+            'megapixels_per_second': round(item['megapixels'] / median, 3) if median > 0 else None,
+        }
+        results.append(result)
+        status = '' if ok else '  失败'
+        print(f"[{index}/{len(cases)}] {engine:<3} {config:<15} {item['image']:<28} "
+              f"中位数 {median * 1000:9.1f} ms  {result['megapixels_per_second'] or 0:8.2f} MP/s{status}")
+    return results
+
+
+def case_key(result):
+    return result['engine'], result['config'], result['image']
+
+
+def compare_results(baseline_path, results):
+    """
+    与之前保存的结果比较中位数耗时，比值大于1表示变慢
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {case_key(r): r for r in json.load(f)['results']}
+    print(f"\n与基准结果比较: {baseline_path}")
+    for result in results:
+        old = baseline.get(case_key(result))
+        if not old or not old['median']:
+            continue
+        ratio = result['median'] / old['median']
+        print(f"{result['engine']:<3} {result['config']:<15} {result['image']:<28} "
+              f"{old['median'] * 1000:9.1f} ms -> {result['median'] * 1000:9.1f} ms  x{ratio:.2f}")
+
+
+def parse_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def parse_sizes(value):
+    try:
+        sizes = [float(item) if '.' in item else int(item) for item in parse_list(value)]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的图片尺寸列表: {value}")
+    if not sizes or any(size <= 0 for size in sizes):
+        raise argparse.ArgumentTypeError(f"无效的图片尺寸列表: {value}")
+    return sizes
+
+
+def check_choices(values, choices, name):
+    unknown = [value for value in values if value not in choices]
+    if unknown:
+        raise SystemExit(f"未知的{name}: {', '.join(unknown)}（可选: {', '.join(choices)}）")
+    return values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='水印引擎吞吐量基准测试（使用合成图片，结果写入JSON）')
+    parser.add_argument('--sizes', type=parse_sizes, default=DEFAULT_SIZES,
+                        help='测试图片的像素数（百万像素，逗号分隔，默认：1,12,24，最大可到100）')
+    parser.add_argument('--kinds', type=parse_list, default=list(CORPUS_KINDS),
+                        help=f"测试图片类型（逗号分隔，默认全部：{','.join(CORPUS_KINDS)}）")
+    parser.add_argument('--engines', type=parse_list, default=['cli', 'gui'], help='测试的引擎：cli、gui（默认两者）')
+    parser.add_argument('--gui-configs', type=parse_list, default=list(GUI_CONFIGS),
+                        help=f"GUI导出配置（逗号分隔，默认全部：{','.join(GUI_CONFIGS)}）")
+    parser.add_argument('--cli-configs', type=parse_list, default=list(CLI_CONFIGS),
+                        help=f"命令行配置（逗号分隔，默认全部：{','.join(CLI_CONFIGS)}）")
+    parser.add_argument('--repeat', type=int, default=3, help='每个配置重复执行的次数（默认：3）')
+    parser.add_argument('--corpus-dir', default=DEFAULT_CORPUS_DIR, help='合成测试图片的保存目录（已生成的图片会被复用）')
+    parser.add_argument('--output', '-o', default=DEFAULT_OUTPUT, help=f'结果JSON文件（默认：{DEFAULT_OUTPUT}）')
+    parser.add_argument('--compare', metavar='BASELINE', help='与之前保存的结果JSON比较中位数耗时')
+    args = parser.parse_args()
+
+    check_choices(args.kinds, CORPUS_KINDS, '图片类型')
+    check_choices(args.engines, ['cli', 'gui'], '引擎')
+    check_choices(args.gui_configs, GUI_CONFIGS, 'GUI配置')
+    check_choices(args.cli_configs, CLI_CONFIGS, '命令行配置')
+    if args.repeat < 1:
+        raise SystemExit('--repeat 必须是正整数')
+
+    corpus = build_corpus(args.corpus_dir, args.sizes, args.kinds)
+    bench_output_dir = os.path.join(args.corpus_dir, 'output')
+    results = run_benchmarks(corpus, args.engines, args.gui_configs, args.cli_configs, bench_output_dir, args.repeat)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': get_git_commit(),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到: {args.output}")
+
+    if args.compare:
+        compare_results(args.compare, results)
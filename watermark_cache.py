@@ -0,0 +1,29 @@
+import os
+import sys
+
+
+# 每用户缓存根目录下本程序使用的子目录名
+CACHE_DIR_NAME = 'photo-watermark'
+
+
+def get_user_cache_dir():
+    """
+    返回本程序的每用户缓存目录（不创建目录）：
+    Windows为 %LOCALAPPDATA%，macOS为 ~/Library/Caches，其他系统为 $XDG_CACHE_HOME（默认 ~/.cache）下的 CACHE_DIR_NAME。
+    元数据索引、缩略图和字体索引都保存在这个目录中，程序安装在只读目录时缓存仍然可用
+    """
+    home = os.path.expanduser('~')
+    if sys.platform.startswith('win'):
+        cache_home = os.environ.get('LOCALAPPDATA') or os.path.join(home, 'AppData', 'Local')
+    elif sys.platform == 'darwin':
+        cache_home = os.path.join(home, 'Library', 'Caches')
+    else:
+        # XDG规范要求使用绝对路径，相对路径视为未设置
+        cache_home = os.environ.get('XDG_CACHE_HOME', '')
+        if not os.path.isabs(cache_home):
+            cache_home = os.path.join(home, '.cache')
+    return os.path.join(cache_home, CACHE_DIR_NAME)
+
+
+# 默认的缓存根目录
+USER_CACHE_DIR = get_user_cache_dir()
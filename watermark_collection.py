@@ -0,0 +1,80 @@
+import itertools
+
+
+class ImageCollection:
+    """
+    已导入图片的有序集合。每张图片有一个稳定的id，删除其他图片后id不变；
+    按路径判断是否已导入、按id查找和删除都是O(1)。
+    按行号访问（虚拟列表滚动时使用）的顺序表在删除后第一次访问时才重建。
+    只应在界面线程中使用。
+    """
+
+    def __init__(self):
+        self._next_id = itertools.count(1)
+        # id -> 图片路径，按导入顺序排列
+        self._paths = {}
+        # 图片路径 -> id
+        self._ids = {}
+        # 按顺序排列的id，删除后置为None，下次按行号访问时重建
+        self._order = []
+
+    def add(self, image_path):
+        """
+        添加图片，返回新图片的id；图片已在集合中时返回None
+        """
+        if image_path in self._ids:
+            return None
+        image_id = next(self._next_id)
+        self._paths[image_id] = image_path
+        self._ids[image_path] = image_id
+        if self._order is not None:
+            self._order.append(image_id)
+        return image_id
+
+    def remove(self, image_id):
+        """
+        删除图片，返回其路径；id不存在时返回None
+        """
+        image_path = self._paths.pop(image_id, None)
+        if image_path is not None:
+            del self._ids[image_path]
+            self._order = None
+        return image_path
+
+    def clear(self):
+        self._paths.clear()
+        self._ids.clear()
+        self._order = []
+
+    def get(self, image_id):
+        """
+        返回id对应的图片路径，id不存在时返回None
+        """
+        return self._paths.get(image_id)
+
+    def id_of(self, image_path):
+        return self._ids.get(image_path)
+
+    def id_at(self, index):
+        """
+        返回第 index 行图片的id
+        """
+        if self._order is None:
+            self._order = list(self._paths)
+        return self._order[index]
+
+    def items(self):
+        """
+        按导入顺序返回 (id, 图片路径)
+        """
+        return self._paths.items()
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __iter__(self):
+        # 按导入顺序返回图片路径，与原来的路径列表用法一致
+        return iter(self._paths.values())
+
+    def __contains__(self, image_path):
+        return image_path in self._ids
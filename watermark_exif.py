@@ -0,0 +1,235 @@
+import struct
+from datetime import datetime
+
+
+# 日期标签按优先级排列：(exifread中的标签名, TIFF标签号, 是否位于Exif子IFD)
+EXIF_DATE_TAGS = [
+    ('EXIF DateTimeOriginal', 0x9003, True),
+    ('EXIF DateTimeDigitized', 0x9004, True),
+    ('Image DateTime', 0x0132, False),
+]
+
+TAG_EXIF_IFD = 0x8769
+
+# IFD1中嵌入的JPEG缩略图的偏移量和长度
+TAG_THUMBNAIL_OFFSET = 0x0201
+TAG_THUMBNAIL_LENGTH = 0x0202
+
+# TIFF字段类型
+TYPE_ASCII = 2
+TYPE_SHORT = 3
+TYPE_LONG = 4
+
+# 单个IFD允许的最大条目数，超出时视为文件损坏
+MAX_IFD_ENTRIES = 1024
+
+# 嵌入缩略图允许的最大字节数（APP1段最大64KB），超出时视为文件损坏
+MAX_THUMBNAIL_BYTES = 64 * 1024
+
+
+class ExifFormatError(Exception):
+    """快速解析无法识别文件结构时抛出，调用方应回退到完整解析"""
+
+
+def parse_exif_datetime(datetime_str):
+    """
+    解析EXIF日期时间字符串（通常格式为 'YYYY:MM:DD HH:MM:SS'），返回年月日格式，无效时返回None
+    """
+    try:
+        dt = datetime.strptime(datetime_str.strip(), '%Y:%m:%d %H:%M:%S')
+        return dt.strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def _read_at(fp, offset, size):
+    fp.seek(offset)
+    data = fp.read(size)
+    if len(data) != size:
+        raise ExifFormatError("文件在EXIF结构中途结束")
+    return data
+
+
+def _find_jpeg_tiff_header(fp):
+    """
+    顺序跳过JPEG标记段，返回APP1 (Exif) 段中TIFF头的偏移量，没有EXIF时返回None
+    """
+    offset = 2
+    while True:
+        marker = _read_at(fp, offset, 4)
+        if marker[0] != 0xFF:
+            raise ExifFormatError("无效的JPEG标记")
+        marker_type = marker[1]
+        if marker_type == 0xFF:
+            # 填充字节
+            offset += 1
+            continue
+        if marker_type == 0x01 or 0xD0 <= marker_type <= 0xD8:
+            # 没有长度字段的独立标记
+            offset += 2
+            continue
+        if marker_type in (0xDA, 0xD9):
+            # 到达图像数据或文件结束，EXIF段只会出现在这之前
+            return None
+        length = struct.unpack('>H', marker[2:4])[0]
+        if length < 2:
+            raise ExifFormatError("无效的JPEG段长度")
+        if marker_type == 0xE1 and length >= 8:
+            if _read_at(fp, offset + 4, 6) == b'Exif\x00\x00':
+                return offset + 10
+        offset += 2 + length
+
+
+def _read_ifd(fp, base, ifd_offset, byte_order):
+    """
+    读取一个IFD，返回 {标签号: (类型, 数量, 值或偏移字段)}
+    """
+    count = struct.unpack(byte_order + 'H', _read_at(fp, base + ifd_offset, 2))[0]
+    if count > MAX_IFD_ENTRIES:
+        raise ExifFormatError("IFD条目数异常")
+    data = _read_at(fp, base + ifd_offset + 2, count * 12)
+    entries = {}
+    for i in range(count):
+        tag, field_type, value_count = struct.unpack(byte_order + 'HHI', data[i * 12:i * 12 + 8])
+        entries[tag] = (field_type, value_count, data[i * 12 + 8:i * 12 + 12])
+    return entries
+
+
+def _read_next_ifd_offset(fp, base, ifd_offset, byte_order):
+    """
+    返回IFD之后下一个IFD的偏移量，没有下一个IFD时为0
+    """
+    count = struct.unpack(byte_order + 'H', _read_at(fp, base + ifd_offset, 2))[0]
+    return struct.unpack(byte_order + 'I', _read_at(fp, base + ifd_offset + 2 + count * 12, 4))[0]
+
+
+def _read_int(entry, byte_order):
+    field_type, value_count, value = entry
+    if value_count != 1:
+        return None
+    if field_type == TYPE_LONG:
+        return struct.unpack(byte_order + 'I', value)[0]
+    if field_type == TYPE_SHORT:
+        return struct.unpack(byte_order + 'H', value[:2])[0]
+    return None
+
+
+def _read_ascii(fp, base, entry, byte_order):
+    field_type, value_count, value = entry
+    if field_type != TYPE_ASCII or value_count == 0:
+        return None
+    if value_count <= 4:
+        raw = value[:value_count]
+    else:
+        offset = struct.unpack(byte_order + 'I', value)[0]
+        raw = _read_at(fp, base + offset, value_count)
+    return raw.split(b'\x00', 1)[0].decode('ascii', errors='ignore')
+
+
+def _read_tiff_header(fp):
+    """
+    定位EXIF数据的TIFF头，返回 (TIFF头偏移量, 字节序, IFD0偏移量)；JPEG中没有EXIF时返回None。
+    无法识别文件结构时抛出 ExifFormatError。
+    """
+    head = fp.read(4)
+    if head[:2] == b'\xff\xd8':
+        base = _find_jpeg_tiff_header(fp)
+        if base is None:
+            return None
+    elif head in (b'II*\x00', b'MM\x00*'):
+        base = 0
+    else:
+        raise ExifFormatError("不支持快速解析的文件格式")
+
+    header = _read_at(fp, base, 8)
+    if header[:2] == b'II':
+        byte_order = '<'
+    elif header[:2] == b'MM':
+        byte_order = '>'
+    else:
+        raise ExifFormatError("无效的TIFF字节序")
+    magic, ifd0_offset = struct.unpack(byte_order + 'HI', header[2:8])
+    if magic != 42:
+        raise ExifFormatError("无效的TIFF头")
+    return base, byte_order, ifd0_offset
+
+
+def find_exif_date(fp):
+    """
+    只读取文件头部的EXIF结构（JPEG的APP1段或TIFF头），按优先级查找日期标签，
+    找到第一个有效日期后立即返回 (标签名, 'YYYY-MM-DD')；没有日期标签时返回None。
+    无法识别文件结构时抛出 ExifFormatError。
+    """
+    tiff_header = _read_tiff_header(fp)
+    if tiff_header is None:
+        return None
+    base, byte_order, ifd0_offset = tiff_header
+
+    ifd0 = _read_ifd(fp, base, ifd0_offset, byte_order)
+    exif_ifd = {}
+    if TAG_EXIF_IFD in ifd0:
+        field_type, _, value = ifd0[TAG_EXIF_IFD]
+        if field_type == TYPE_LONG:
+            exif_ifd = _read_ifd(fp, base, struct.unpack(byte_order + 'I', value)[0], byte_order)
+
+    for tag_name, tag, in_exif_ifd in EXIF_DATE_TAGS:
+        entries = exif_ifd if in_exif_ifd else ifd0
+        if tag not in entries:
+            continue
+        datetime_str = _read_ascii(fp, base, entries[tag], byte_order)
+        date = parse_exif_datetime(datetime_str) if datetime_str else None
+        if date:
+            return tag_name, date
+    return None
+
+
+def find_exif_thumbnail(fp):
+    """
+    读取IFD1中嵌入的JPEG缩略图（相机通常写入160×120左右的缩略图），返回JPEG数据，没有时返回None。
+    只读取EXIF结构和缩略图本身，不读取图像数据。无法识别文件结构时抛出 ExifFormatError。
+    """
+    tiff_header = _read_tiff_header(fp)
+    if tiff_header is None:
+        return None
+    base, byte_order, ifd0_offset = tiff_header
+
+    ifd1_offset = _read_next_ifd_offset(fp, base, ifd0_offset, byte_order)
+    if ifd1_offset == 0:
+        return None
+    ifd1 = _read_ifd(fp, base, ifd1_offset, byte_order)
+    if TAG_THUMBNAIL_OFFSET not in ifd1 or TAG_THUMBNAIL_LENGTH not in ifd1:
+        return None
+    offset = _read_int(ifd1[TAG_THUMBNAIL_OFFSET], byte_order)
+    length = _read_int(ifd1[TAG_THUMBNAIL_LENGTH], byte_order)
+    if not offset or not length or length > MAX_THUMBNAIL_BYTES:
+        return None
+    data = _read_at(fp, base + offset, length)
+    if data[:2] != b'\xff\xd8':
+        return None
+    return data
+
+
+def find_exif_date_full(fp):
+    """
+    使用exifread完整解析EXIF查找日期标签，返回 (标签名, 'YYYY-MM-DD') 或None
+    """
+    import exifread
+    tags = exifread.process_file(fp, details=False)
+    for tag_name, _, _ in EXIF_DATE_TAGS:
+        if tag_name in tags:
+            date = parse_exif_datetime(str(tags[tag_name]))
+            if date:
+                return tag_name, date
+    return None
+
+
+def read_exif_date(fp):
+    """
+    从已打开的二进制文件中读取拍摄日期，返回 (标签名, 'YYYY-MM-DD') 或None。
+    优先使用只读取文件头部的快速解析，失败时回退到exifread完整解析。
+    """
+    try:
+        return find_exif_date(fp)
+    except (ExifFormatError, struct.error):
+        fp.seek(0)
+        return find_exif_date_full(fp)
@@ -0,0 +1,537 @@
+import io
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from datetime import datetime
+from PIL import Image
+from watermark_fonts import get_font, get_default_font
+from watermark_index import get_image_metadata, read_source_file
+from watermark_jpeg import JpegRegionError, find_jpegtran, recompress_region
+from watermark_manifest import BatchManifest, settings_digest
+from watermark_pipeline import StagePipeline
+from watermark_render import get_watermark_stamp, normalize_image_mode, composite_stamp, get_target_size, load_resized_image
+
+
+# 一次导出使用的全部水印和导出设置。在界面线程中创建后不再改变，
+# 导出线程（或进程）只读取这个对象，不访问任何Tk变量
+RenderSettings = namedtuple('RenderSettings', [
+    'text_type', 'custom_text',
+    'font', 'font_size', 'bold', 'italic',
+    'text_color', 'opacity',
+    'position', 'custom_position',
+    'stroke', 'stroke_width', 'stroke_color',
+    'shadow', 'shadow_offset', 'shadow_color',
+    'naming', 'prefix', 'suffix',
+    'output_format', 'quality', 'encoder_preset', 'lossless_region',
+    'resize_method', 'target_width', 'target_height', 'scale_percent',
+])
+
+# 批量导出结果状态
+EXPORT_SUCCESS = 'success'
+EXPORT_FAILED = 'failed'
+EXPORT_SKIPPED = 'skipped'
+
+# 批量导出方式：线程池、进程池、分阶段流水线
+WORKER_THREAD = 'thread'
+WORKER_PROCESS = 'process'
+WORKER_PIPELINE = 'pipeline'
+
+# 流水线模式下读取和写入阶段的默认线程数
+DEFAULT_IO_WORKERS = 2
+
+# 编码预设：预设名 -> 各输出格式传给 Image.save 的编码参数（JPEG质量由 quality 单独设置）。
+# default 与之前的输出一致；fast 用于样张，编码最快；small 用于网页发布，文件最小；
+# fidelity 保留全部色度信息，适合需要再次编辑的图片。
+# Pillow的JPEG默认编码（不优化霍夫曼表、顺序式、4:2:0抽样）已经是最快的方式，没有更快的JPEG预设，fast对JPEG与default相同
+ENCODER_PRESETS = {
+    'default': {
+        'JPEG': {},
+        'PNG': {},
+        'WEBP': {'method': 4},
+    },
+    'fast': {
+        'JPEG': {},
+        'PNG': {'compress_level': 1},
+        'WEBP': {'method': 0},
+    },
+    'small': {
+        'JPEG': {'optimize': True, 'progressive': True, 'subsampling': '4:2:0'},
+        'PNG': {'optimize': True},
+        'WEBP': {'method': 6},
+    },
+    'fidelity': {
+        'JPEG': {'optimize': True, 'subsampling': '4:4:4'},
+        'PNG': {'compress_level': 9},
+        'WEBP': {'method': 4, 'exact': True},
+    },
+}
+DEFAULT_ENCODER_PRESET = 'default'
+
+# 水印与图片边缘的距离
+WATERMARK_MARGIN = 10
+
+# 预定义颜色映射
+COLOR_MAP = {
+    'black': (0, 0, 0, 255),
+    'white': (255, 255, 255, 255),
+    'red': (255, 0, 0, 255),
+    'green': (0, 255, 0, 255),
+    'blue': (0, 0, 255, 255),
+    'yellow': (255, 255, 0, 255),
+    'cyan': (0, 255, 255, 255),
+    'magenta': (255, 0, 255, 255),
+    'gray': (128, 128, 128, 255),
+    'grey': (128, 128, 128, 255),
+    'orange': (255, 165, 0, 255),
+    'purple': (128, 0, 128, 255),
+    'brown': (165, 42, 42, 255),
+    'pink': (255, 192, 203, 255)
+}
+
+
+def parse_color(color_str, opacity=100):
+    """
+    解析颜色字符串（预定义颜色名、#RRGGBB[AA]、(r,g,b[,a])），返回RGBA元组。
+    opacity参数控制透明度(0-100%)，值越大透明度越高
+    """
+    print(f"解析颜色: '{color_str}', 透明度设置: {opacity}%")
+
+    # 检查是否为预定义颜色
+    if color_str.lower() in COLOR_MAP:
+        r, g, b, a = COLOR_MAP[color_str.lower()]
+        # 应用透明度：opacity值越大，透明度越高
+        a = int(a * (100 - opacity) / 100)
+        print(f"使用预定义颜色: {color_str} -> RGBA: ({r}, {g}, {b}, {a})")
+        return (r, g, b, a)
+
+    # 检查是否为十六进制颜色
+    hex_pattern = r'^#([0-9a-fA-F]{6})([0-9a-fA-F]{2})?$'
+    match = re.match(hex_pattern, color_str)
+    if match:
+        rgb_hex = match.group(1)
+        alpha_hex = match.group(2) or 'FF'
+        r = int(rgb_hex[0:2], 16)
+        g = int(rgb_hex[2:4], 16)
+        b = int(rgb_hex[4:6], 16)
+        a = int(alpha_hex, 16)
+        # 应用透明度：opacity值越大，透明度越高
+        a = int(a * (100 - opacity) / 100)
+        print(f"使用十六进制颜色: {color_str} -> RGBA: ({r}, {g}, {b}, {a})")
+        return (r, g, b, a)
+
+    # 检查是否为RGB/RGBA元组格式
+    tuple_pattern = r'^\((\d{1,3}),(\d{1,3}),(\d{1,3})(?:,(\d{1,3}))?\)$'
+    match = re.match(tuple_pattern, color_str)
+    if match:
+        r = int(match.group(1))
+        g = int(match.group(2))
+        b = int(match.group(3))
+        a = int(match.group(4)) if match.group(4) else 255
+        # 确保值在有效范围内
+        r = max(0, min(255, r))
+        g = max(0, min(255, g))
+        b = max(0, min(255, b))
+        a = max(0, min(255, a))
+        # 应用透明度：opacity值越大，透明度越高
+        a = int(a * (100 - opacity) / 100)
+        print(f"使用RGB元组颜色: {color_str} -> RGBA: ({r}, {g}, {b}, {a})")
+        return (r, g, b, a)
+
+    # 默认返回黑色，但使用与前面一致的透明度计算方式
+    print(f"警告: 无法解析颜色 '{color_str}'，使用默认黑色")
+    return (0, 0, 0, int(255 * (100 - opacity) / 100))
+
+
+def get_settings_digest(settings):
+    """
+    计算影响输出结果的设置的哈希值，用于增量处理时判断图片是否需要重新处理
+    """
+    return settings_digest(settings._asdict())
+
+
+def get_image_date(image_path, source=None):
+    """
+    获取图片的水印日期：优先使用EXIF拍摄日期，否则使用文件修改时间。
+    结果保存在元数据索引中，文件未变化时只需要一次stat。
+    source 为 read_source_file 的结果时使用其中的文件内容和stat结果，不再访问文件
+    """
+    try:
+        return get_image_metadata(image_path, source=source).date
+    except Exception as e:
+        print(f"读取图片元数据时出错 {image_path}: {e}")
+        mtime = source.stat.st_mtime if source is not None else os.path.getmtime(image_path)
+        return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d')
+
+
+def get_watermark_text(image_path, settings, source=None):
+    """
+    根据水印类型获取水印文本，自定义文本为空时使用日期
+    """
+    if settings.text_type == "custom":
+        watermark_text = settings.custom_text.strip()
+        if watermark_text:
+            return watermark_text
+    # 拍摄日期（无EXIF时为文件修改时间），文件未变化时直接从元数据索引读取
+    return get_image_date(image_path, source)
+
+
+def get_output_filename(image_path, settings):
+    """
+    根据命名规则和输出格式生成输出文件名
+    """
+    filename = os.path.basename(image_path)
+    name_without_ext, ext = os.path.splitext(filename)
+
+    # 应用命名规则
+    if settings.naming == 'original':
+        output_filename = filename
+    elif settings.naming == 'prefix':
+        output_filename = f"{settings.prefix}{filename}"
+    else:  # suffix
+        output_filename = f"{name_without_ext}{settings.suffix}{ext}"
+
+    # 根据输出格式调整扩展名
+    if settings.output_format == 'PNG':
+        output_filename = os.path.splitext(output_filename)[0] + '.png'
+    elif settings.output_format == 'JPG':
+        output_filename = os.path.splitext(output_filename)[0] + '.jpg'
+    elif settings.output_format == 'WEBP':
+        output_filename = os.path.splitext(output_filename)[0] + '.webp'
+    else:  # JPEG
+        output_filename = os.path.splitext(output_filename)[0] + '.jpeg'
+    return output_filename
+
+
+def get_watermark_position(width, height, text_width, text_height, settings):
+    """
+    计算水印文本左上角在图片中的位置
+    """
+    margin = WATERMARK_MARGIN
+    position = settings.position
+    if position == 'custom' and settings.custom_position:
+        # 使用拖拽设置的自定义位置（水印中心的相对坐标）
+        rel_x, rel_y = settings.custom_position
+        return int(width * rel_x) - text_width // 2, int(height * rel_y) - text_height // 2
+    if position == 'top-left':
+        return margin, margin
+    if position == 'top-right':
+        return width - text_width - margin, margin
+    if position == 'bottom-left':
+        return margin, height - text_height - margin
+    if position == 'center':
+        return (width - text_width) // 2, (height - text_height) // 2
+    if position == 'top':
+        return (width - text_width) // 2, margin
+    if position == 'bottom':
+        return (width - text_width) // 2, height - text_height - margin
+    if position == 'left':
+        return margin, (height - text_height) // 2
+    if position == 'right':
+        return width - text_width - margin, (height - text_height) // 2
+    # 默认右下角
+    return width - text_width - margin, height - text_height - margin
+
+
+def get_stamp_effects(settings):
+    """
+    返回水印图块的描边和阴影参数：(宽度/偏移, 颜色RGBA)，未启用时为None
+    """
+    stroke = None
+    if settings.stroke:
+        stroke = (settings.stroke_width, parse_color(settings.stroke_color, settings.opacity))
+    shadow = None
+    if settings.shadow:
+        shadow = (settings.shadow_offset, parse_color(settings.shadow_color, settings.opacity))
+    return stroke, shadow
+
+
+def place_watermark(size, watermark_text, settings):
+    """
+    返回水印图块和图块左上角在图片（尺寸为 size）中的位置：(图块, (x, y))
+    """
+    width, height = size
+    font = get_font(settings.font, settings.font_size, settings.bold, settings.italic)
+    if font is get_default_font():
+        print(f"字体 '{settings.font}' 不可用，使用默认字体")
+
+    # 获取文本大小
+    bbox = font.getbbox(watermark_text)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+    x, y = get_watermark_position(width, height, text_width, text_height, settings)
+
+    # 获取预渲染的水印图块（文本、描边、阴影），相同设置的图片共用同一个图块
+    text_color_rgba = parse_color(settings.text_color, settings.opacity)
+    stroke, shadow = get_stamp_effects(settings)
+    stamp, (offset_x, offset_y) = get_watermark_stamp(
+        watermark_text, settings.font, settings.font_size, text_color_rgba, stroke, shadow, settings.bold, settings.italic)
+
+    return stamp, (int(x) + offset_x, int(y) + offset_y)
+
+
+def apply_watermark(img, watermark_text, settings):
+    """
+    在图片上合成水印，图片应为RGB或RGBA模式（见 normalize_image_mode），原地修改并返回图片
+    """
+    stamp, position = place_watermark(img.size, watermark_text, settings)
+    # 只在水印覆盖的区域内合成，不创建整幅图片大小的图层
+    return composite_stamp(img, stamp, position)
+
+
+def decode_image(source, settings):
+    """
+    打开并解码图片（source 为文件路径或文件对象），按设置调整尺寸并转换为可合成水印的模式
+    """
+    img = Image.open(source)
+    width, height = img.size
+
+    # 根据调整方式调整图片尺寸
+    target_size = get_target_size(width, height, settings.resize_method, settings.target_width,
+                                  settings.target_height, settings.scale_percent)
+    if target_size:
+        # 大幅缩小JPEG时先用DCT缩放解码为较小尺寸，再进行最终的重采样
+        img = load_resized_image(img, target_size)
+
+    # 保持原图模式，仅对无法直接合成的模式进行转换
+    img = normalize_image_mode(img)
+    img.load()
+    return img
+
+
+def get_encoder_options(settings):
+    """
+    返回 (PIL格式名, 编码参数)。JPG与JPEG使用相同的编码器，未知的预设名按默认预设处理
+    """
+    image_format = 'JPEG' if settings.output_format == 'JPG' else settings.output_format
+    if image_format not in ('JPEG', 'PNG', 'WEBP'):
+        image_format = 'JPEG'
+    preset = ENCODER_PRESETS.get(settings.encoder_preset, ENCODER_PRESETS[DEFAULT_ENCODER_PRESET])
+    options = dict(preset[image_format])
+    if image_format != 'PNG':
+        options['quality'] = settings.quality
+    return image_format, options
+
+
+def save_image(img, output, settings):
+    """
+    按输出格式和编码预设保存图片（output 为文件路径或文件对象），JPEG格式下透明背景转换为白色
+    """
+    image_format, options = get_encoder_options(settings)
+    if image_format == 'JPEG' and img.mode == 'RGBA':
+        # 由于JPEG不支持透明背景，创建白色背景并使用alpha通道作为蒙版
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[3])  # 3 is the alpha channel
+        img = background
+    # PNG和WebP直接保存以保留透明度
+    img.save(output, format=image_format, **options)
+
+
+def encode_jpeg_region(source, watermark_text, settings):
+    """
+    JPEG无损区域模式（默认关闭）：只重新编码水印覆盖的MCU，其余部分的DCT系数保持不变，避免再次压缩的画质损失，
+    返回输出文件内容。水印区域沿用原图的量化表，不使用质量设置。
+    未启用该模式、输出或输入不是JPEG、需要调整尺寸或无法处理时返回None，调用方应重新编码整幅图片
+    """
+    if not settings.lossless_region or settings.output_format not in ('JPEG', 'JPG'):
+        return None
+    # 没有安装jpegtran时 find_jpegtran 只提示一次
+    if not source.data.startswith(b'\xff\xd8') or find_jpegtran() is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(source.data)) as img:
+            size = img.size
+    except (IOError, OSError, SyntaxError):
+        return None
+    if get_target_size(size[0], size[1], settings.resize_method, settings.target_width,
+                       settings.target_height, settings.scale_percent):
+        return None
+
+    stamp, position = place_watermark(size, watermark_text, settings)
+    # 未改变的MCU沿用原图的编码，质量设置不起作用；编码预设中的优化和渐进式编码仍然有效
+    _, options = get_encoder_options(settings)
+    try:
+        return recompress_region(source.data, stamp, position,
+                                 options.get('optimize', False), options.get('progressive', False))
+    except JpegRegionError as e:
+        print(f"无法只重新编码水印区域，将重新编码整幅图片 {source.path}: {e}")
+        return None
+
+
+def export_image(image_path, output_dir, settings, stat_result=None):
+    """
+    为一张图片添加水印并保存到输出目录，只使用 settings 中的设置，可以在任意线程或进程中调用。
+    输入文件只读取一次，stat_result 为已经获取的stat结果（增量处理时）。
+    成功返回True，失败时打印错误并返回False
+    """
+    try:
+        print(f"\n=== 开始处理图片: {os.path.basename(image_path)} ===")
+        source = read_source_file(image_path, stat_result)
+        watermark_text = get_watermark_text(image_path, settings, source)
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, get_output_filename(image_path, settings))
+
+        data = encode_jpeg_region(source, watermark_text, settings)
+        if data is not None:
+            with open(output_path, 'wb') as f:
+                f.write(data)
+        else:
+            img = decode_image(io.BytesIO(source.data), settings)
+            img = apply_watermark(img, watermark_text, settings)
+            save_image(img, output_path, settings)
+        print(f"已保存图片: {output_path}")
+        return True
+    except Exception as e:
+        print(f"处理图片时出错 {image_path}: {e}")
+        return False
+
+
+def create_export_pipeline(output_dir, settings, cpu_workers, io_workers=DEFAULT_IO_WORKERS):
+    """
+    创建分阶段的导出流水线：读取文件 -> 解码 -> 合成水印 -> 编码 -> 写入文件。
+    读取和写入阶段使用 io_workers 个线程，解码、合成和编码阶段各使用 cpu_workers 个线程
+    （Pillow在解码、缩放和编码时会释放GIL）。提交的任务为图片路径和已经获取的stat结果（可以为None）。
+    每个输入文件只读取一次，水印日期在解码阶段从同一份内容中解析
+    """
+    def read(image_path, stat_result):
+        return read_source_file(image_path, stat_result)
+
+    def decode(image_path, source):
+        watermark_text = get_watermark_text(image_path, settings, source)
+        # JPEG无损区域模式直接得到输出文件内容，跳过合成和编码阶段
+        data = encode_jpeg_region(source, watermark_text, settings)
+        if data is not None:
+            return data
+        img = decode_image(io.BytesIO(source.data), settings)
+        return img, watermark_text
+
+    def composite(image_path, decoded):
+        if isinstance(decoded, bytes):
+            return decoded
+        img, watermark_text = decoded
+        return apply_watermark(img, watermark_text, settings)
+
+    def encode(image_path, img):
+        if isinstance(img, bytes):
+            return img
+        buffer = io.BytesIO()
+        save_image(img, buffer, settings)
+        return buffer.getvalue()
+
+    def write(image_path, data):
+        output_path = os.path.join(output_dir, get_output_filename(image_path, settings))
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        print(f"已保存图片: {output_path}")
+
+    return StagePipeline([
+        ('read', read, io_workers),
+        ('decode', decode, cpu_workers),
+        ('composite', composite, cpu_workers),
+        ('encode', encode, cpu_workers),
+        ('write', write, io_workers),
+    ], queue_size=cpu_workers * 2)
+
+
+def export_images(image_paths, output_dir, settings, jobs=1, worker_mode=WORKER_THREAD, incremental=False, on_result=None,
+                  io_jobs=DEFAULT_IO_WORKERS):
+    """
+    批量导出图片。worker_mode 为 WORKER_THREAD 或 WORKER_PROCESS 且jobs大于1时使用线程池或进程池并行处理；
+    为 WORKER_PIPELINE 时使用分阶段流水线，jobs为每个计算阶段的线程数，io_jobs为读取和写入阶段的线程数。
+    每张图片完成后在调用线程中调用 on_result(图片路径, 状态)，状态为 EXPORT_SUCCESS、EXPORT_FAILED 或 EXPORT_SKIPPED。
+    incremental 为True时，跳过输入文件和设置都没有变化且输出文件存在的图片。
+    返回 (成功数, 失败数, 跳过数)
+    """
+    counts = {EXPORT_SUCCESS: 0, EXPORT_FAILED: 0, EXPORT_SKIPPED: 0}
+
+    # 增量处理：通过输出文件夹中的清单跳过未变化的图片，中断后再次处理会从中断处继续
+    manifest = None
+    if incremental:
+        manifest = BatchManifest(output_dir)
+        digest = get_settings_digest(settings)
+    # 处理前的输入文件状态，用于写入增量处理清单
+    input_stats = {}
+
+    def get_output_path(image_path):
+        return os.path.join(output_dir, get_output_filename(image_path, settings))
+
+    def report(image_path, status):
+        counts[status] += 1
+        if on_result:
+            on_result(image_path, status)
+
+    def needs_processing(image_path):
+        if manifest is None:
+            return True
+        try:
+            stat_result = os.stat(image_path)
+        except OSError:
+            # 交给 export_image 报告错误
+            return True
+        if manifest.is_up_to_date(image_path, get_output_path(image_path), digest, stat_result):
+            report(image_path, EXPORT_SKIPPED)
+            return False
+        input_stats[image_path] = stat_result
+        return True
+
+    def finish(image_path, success):
+        if success:
+            if manifest is not None and image_path in input_stats:
+                manifest.record(image_path, get_output_path(image_path), digest, input_stats.pop(image_path))
+            report(image_path, EXPORT_SUCCESS)
+        else:
+            report(image_path, EXPORT_FAILED)
+
+    if worker_mode == WORKER_PIPELINE:
+        os.makedirs(output_dir, exist_ok=True)
+        pipeline = create_export_pipeline(output_dir, settings, max(1, jobs), max(1, io_jobs))
+        try:
+            for image_path in image_paths:
+                if not needs_processing(image_path):
+                    continue
+                # 第一个阶段的队列已满时在这里阻塞，等待流水线处理
+                pipeline.submit(image_path, input_stats.get(image_path))
+                for done_path, success in pipeline.completed():
+                    finish(done_path, success)
+        finally:
+            pipeline.close()
+        for done_path, success in pipeline.completed(block=True):
+            finish(done_path, success)
+        pipeline.join()
+    elif jobs <= 1:
+        for image_path in image_paths:
+            if needs_processing(image_path):
+                finish(image_path, export_image(image_path, output_dir, settings, input_stats.get(image_path)))
+    else:
+        # 预先创建输出目录，避免多个工作线程（进程）同时创建
+        os.makedirs(output_dir, exist_ok=True)
+        # 限制同时提交的任务数，使内存占用不随图片数量增长
+        max_pending = jobs * 4
+        executor_class = ProcessPoolExecutor if worker_mode == WORKER_PROCESS else ThreadPoolExecutor
+        with executor_class(max_workers=jobs) as executor:
+            pending = {}
+
+            def collect(futures):
+                for future in futures:
+                    image_path = pending.pop(future)
+                    try:
+                        success = future.result()
+                    except Exception as e:
+                        # 子进程异常退出等情况，export_image 本身无法报告
+                        print(f"处理图片时出错 {image_path}: {e}")
+                        success = False
+                    finish(image_path, success)
+
+            for image_path in image_paths:
+                if not needs_processing(image_path):
+                    continue
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                future = executor.submit(export_image, image_path, output_dir, settings, input_stats.get(image_path))
+                pending[future] = image_path
+            collect(list(as_completed(pending)))
+
+    if manifest is not None:
+        manifest.compact()
+    return counts[EXPORT_SUCCESS], counts[EXPORT_FAILED], counts[EXPORT_SKIPPED]
@@ -0,0 +1,400 @@
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from PIL import ImageFont
+from watermark_cache import USER_CACHE_DIR
+
+
+# 预定义常见字体及其文件名映射
+COMMON_FONT_FILES = {
+    'Microsoft YaHei': 'msyh.ttc',
+    'SimHei': 'simhei.ttf',
+    'SimSun': 'simsun.ttc',
+    'Arial': 'arial.ttf',
+    'Times New Roman': 'times.ttf',
+    'Courier New': 'cour.ttf',
+    'KaiTi': 'simkai.ttf',
+    'FangSong': 'simsun.ttc'
+}
+
+# 预定义字体都加载失败时，优先尝试的系统字体文件
+PRIORITY_FONT_FILES = ['arial.ttf', 'simhei.ttf', 'msyh.ttc', 'simsun.ttc', 'times.ttf', 'cour.ttf']
+
+FONT_EXTENSIONS = ('.ttf', '.ttc', '.otf', '.otc')
+
+# 包含多个字体的集合文件，需要按字体索引逐个读取
+FONT_COLLECTION_EXTENSIONS = ('.ttc', '.otc')
+
+# 默认的字体索引文件位置
+DEFAULT_FONT_INDEX_PATH = os.path.join(USER_CACHE_DIR, 'fonts.json')
+
+# 字体索引文件格式版本，格式变化时旧索引会被重建
+FONT_INDEX_VERSION = 1
+
+# 常规、粗体、斜体的标准样式名，同一族中有多个符合的样式时优先选择
+STANDARD_STYLE_NAMES = ('regular', 'normal', 'book', 'roman', 'bold', 'italic', 'oblique', 'bold italic', 'bold oblique')
+
+# 字体对象缓存的最大条目数（不同字体文件、字号、字体索引的组合）
+FONT_CACHE_SIZE = 32
+
+# 解析字体时用于试加载的字号，与实际字号无关
+_PROBE_FONT_SIZE = 12
+
+_lock = threading.Lock()
+# 保证字体索引只被一个线程读取或扫描，其他线程等待同一个结果
+_font_index_lock = threading.Lock()
+# (字体文件, 字号, 字体索引) -> 字体对象，按最近使用顺序排列
+_font_cache = OrderedDict()
+# (字体名称, 粗体, 斜体) -> (字体文件, 字体索引)，解析失败时为None
+_resolved_fonts = {}
+_default_font = None
+_font_index = None
+
+
+def _windows_font_dir():
+    return os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts')
+
+
+def system_font_dirs():
+    """
+    返回当前系统上的字体目录（包括用户字体目录），只返回存在的目录。
+    用户字体目录排在系统字体目录之前，同名字体优先使用用户安装的版本
+    """
+    home = os.path.expanduser('~')
+    if sys.platform.startswith('win'):
+        dirs = []
+        local_app_data = os.environ.get('LOCALAPPDATA')
+        if local_app_data:
+            dirs.append(os.path.join(local_app_data, 'Microsoft', 'Windows', 'Fonts'))
+        dirs.append(_windows_font_dir())
+    elif sys.platform == 'darwin':
+        dirs = [os.path.join(home, 'Library', 'Fonts'), '/Library/Fonts', '/System/Library/Fonts']
+    else:
+        data_home = os.environ.get('XDG_DATA_HOME') or os.path.join(home, '.local', 'share')
+        data_dirs = (os.environ.get('XDG_DATA_DIRS') or '/usr/local/share:/usr/share').split(':')
+        dirs = [os.path.join(data_home, 'fonts'), os.path.join(home, '.fonts')]
+        dirs += [os.path.join(data_dir, 'fonts') for data_dir in data_dirs if data_dir]
+    result = []
+    for font_dir in dirs:
+        font_dir = os.path.normpath(font_dir)
+        if os.path.isdir(font_dir) and font_dir not in result:
+            result.append(font_dir)
+    return result
+
+
+def _style_flags(style):
+    """
+    根据样式名判断是否为粗体和斜体，返回 (粗体, 斜体)
+    """
+    style = style.lower()
+    bold = any(word in style for word in ('bold', 'black', 'heavy'))
+    italic = 'italic' in style or 'oblique' in style
+    return bold, italic
+
+
+def _read_font_faces(font_file):
+    """
+    读取字体文件中所有字体的 [族名, 样式名, 字体索引]，无法读取的文件返回空列表
+    """
+    faces = []
+    is_collection = font_file.lower().endswith(FONT_COLLECTION_EXTENSIONS)
+    index = 0
+    while True:
+        try:
+            font = ImageFont.truetype(font_file, _PROBE_FONT_SIZE, index=index)
+        except (IOError, OSError, ValueError):
+            break
+        family, style = font.getname()
+        if family:
+            faces.append([family, style or 'Regular', index])
+        if not is_collection:
+            break
+        index += 1
+    return faces
+
+
+class FontIndex:
+    """
+    系统字体索引：字体族 -> 样式 -> (字体文件, 字体索引)，持久化为JSON文件。
+    索引中记录扫描过的每个目录的修改时间，字体目录没有变化时直接使用索引，不需要打开任何字体文件；
+    有目录变化时重新扫描，未变化的字体文件沿用原来的记录。
+    """
+
+    def __init__(self, index_path=DEFAULT_FONT_INDEX_PATH, font_dirs=None):
+        self.index_path = index_path
+        self.font_dirs = system_font_dirs() if font_dirs is None else font_dirs
+        # 字体文件 -> {'mtime_ns', 'size', 'faces'}
+        self.files = {}
+        # 目录 -> 修改时间ns
+        self.dirs = {}
+        self.families = {}
+        self._families_lower = {}
+
+    def load(self):
+        """
+        读取索引文件，字体目录有变化（或没有索引）时重新扫描并保存
+        """
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == FONT_INDEX_VERSION:
+                self.files = data.get('files', {})
+                self.dirs = data.get('dirs', {})
+        except (OSError, ValueError):
+            pass
+
+        if self._is_stale():
+            self.rebuild()
+        else:
+            self._build_families()
+        return self
+
+    def _is_stale(self):
+        if not self.dirs:
+            return bool(self.font_dirs)
+        if any(font_dir not in self.dirs for font_dir in self.font_dirs):
+            return True
+        for font_dir, mtime_ns in self.dirs.items():
+            try:
+                if os.stat(font_dir).st_mtime_ns != mtime_ns:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def rebuild(self):
+        """
+        扫描所有字体目录并保存索引
+        """
+        print("正在扫描系统字体...")
+        old_files = self.files
+        self.files = {}
+        self.dirs = {}
+        for font_dir in self.font_dirs:
+            for dir_path, _, file_names in os.walk(font_dir):
+                try:
+                    self.dirs[dir_path] = os.stat(dir_path).st_mtime_ns
+                except OSError:
+                    continue
+                for file_name in sorted(file_names):
+                    if not file_name.lower().endswith(FONT_EXTENSIONS):
+                        continue
+                    font_file = os.path.join(dir_path, file_name)
+                    try:
+                        stat_result = os.stat(font_file)
+                    except OSError:
+                        continue
+                    entry = old_files.get(font_file)
+                    if (entry is None or entry.get('mtime_ns') != stat_result.st_mtime_ns
+                            or entry.get('size') != stat_result.st_size):
+                        entry = {'mtime_ns': stat_result.st_mtime_ns, 'size': stat_result.st_size,
+                                 'faces': _read_font_faces(font_file)}
+                    self.files[font_file] = entry
+        self._build_families()
+        self.save()
+        print(f"字体扫描完成，共 {len(self.families)} 个字体族")
+
+    def save(self):
+        data = {'version': FONT_INDEX_VERSION, 'dirs': self.dirs, 'files': self.files}
+        temp_path = f'{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            print(f"保存字体索引时出错: {e}")
+
+    def _build_families(self):
+        self.families = {}
+        # 同一族同一样式出现在多个文件中时，按 font_dirs 的顺序使用靠前目录中的文件（用户字体目录优先）；
+        # 按目录排序而不依赖扫描顺序，旧版本按其他顺序保存的索引同样适用
+        def dir_rank(item):
+            for rank, font_dir in enumerate(self.font_dirs):
+                if item[0].startswith(os.path.join(font_dir, '')):
+                    return rank
+            return len(self.font_dirs)
+
+        for font_file, entry in sorted(self.files.items(), key=dir_rank):
+            for family, style, index in entry.get('faces', []):
+                self.families.setdefault(family, {}).setdefault(style, (font_file, index))
+        self._families_lower = {family.lower(): styles for family, styles in self.families.items()}
+
+    def family_names(self):
+        return sorted(self.families, key=str.lower)
+
+    def find(self, family, bold=False, italic=False):
+        """
+        查找字体族中与粗体/斜体设置对应的字体，返回 (字体文件, 字体索引)；字体族不存在时返回None。
+        字体族没有完全对应的样式时，优先保留粗体，其次保留斜体（如粗斜体缺失时使用粗体）
+        """
+        styles = self.families.get(family) or self._families_lower.get(family.lower())
+        if not styles:
+            return None
+
+        def style_rank(name):
+            style_bold, style_italic = _style_flags(name)
+            mismatch = (style_bold != bold) * 2 + (style_italic != italic)
+            return mismatch, name.lower() not in STANDARD_STYLE_NAMES, len(name), name
+
+        return styles[min(styles, key=style_rank)]
+
+
+def get_font_index():
+    """
+    获取进程内共享的字体索引（第一次调用时读取索引文件，必要时重新扫描）。
+    读取和扫描期间持有锁，同时调用的其他线程等待同一个索引，不会重复扫描
+    """
+    global _font_index
+    with _font_index_lock:
+        if _font_index is None:
+            _font_index = FontIndex().load()
+        return _font_index
+
+
+def is_font_index_ready():
+    """
+    字体索引是否已经读取完成。界面线程应在索引就绪后再解析字体，避免等待字体扫描
+    """
+    return _font_index is not None
+
+
+def list_font_families():
+    """
+    返回系统中所有字体族名称（按名称排序）
+    """
+    return get_font_index().family_names()
+
+
+def _candidate_font_files(font_name):
+    """
+    按优先级生成字体名称可能对应的字体文件
+    """
+    # 直接给出字体文件名或路径时，交给Pillow在系统字体目录中查找
+    if font_name.lower().endswith(FONT_EXTENSIONS):
+        yield font_name
+        return
+
+    # 不在预定义列表中的字体，使用Arial作为替代字体
+    font_file = COMMON_FONT_FILES.get(font_name, COMMON_FONT_FILES['Arial'])
+    if not sys.platform.startswith('win'):
+        yield font_file
+        return
+
+    font_dir = _windows_font_dir()
+    yield os.path.join(font_dir, font_file)
+
+    # 预定义路径加载失败，尝试优先级列表中的字体，再搜索系统字体目录中的所有字体文件
+    for font_file in PRIORITY_FONT_FILES:
+        yield os.path.join(font_dir, font_file)
+    try:
+        file_names = os.listdir(font_dir)
+    except OSError:
+        return
+    for file_name in file_names:
+        if file_name.lower().endswith(FONT_EXTENSIONS):
+            yield os.path.join(font_dir, file_name)
+
+
+def _probe_font_files(font_name):
+    """
+    依次试加载字体名称可能对应的字体文件，返回第一个可用的 (字体文件, 0)，都不可用时返回None
+    """
+    for font_file in _candidate_font_files(font_name):
+        if os.path.isabs(font_file) and not os.path.exists(font_file):
+            continue
+        try:
+            ImageFont.truetype(font_file, _PROBE_FONT_SIZE)
+        except (IOError, OSError, ValueError):
+            continue
+        return font_file, 0
+    return None
+
+
+def resolve_font(font_name, bold=False, italic=False):
+    """
+    将字体名称解析为 (字体文件, 字体索引)，无法解析时返回None。
+    字体族名称优先在系统字体索引中查找对应粗体/斜体的字体，找不到时按预定义的字体文件查找（不区分样式）。
+    解析结果（包括失败）会被记住，每个字体名称和样式在进程内只解析一次。
+    """
+    key = (font_name, bold, italic)
+    with _lock:
+        if key in _resolved_fonts:
+            return _resolved_fonts[key]
+
+    resolved = None
+    if not font_name.lower().endswith(FONT_EXTENSIONS):
+        resolved = get_font_index().find(font_name, bold, italic)
+    if resolved is None:
+        resolved = _probe_font_files(font_name)
+
+    if resolved:
+        print(f"✓ 字体 '{font_name}' 解析为: {resolved[0]}")
+    else:
+        print(f"✗ 无法加载字体 '{font_name}'，使用PIL默认字体")
+
+    with _lock:
+        _resolved_fonts[key] = resolved
+    return resolved
+
+
+def load_font_file(font_file, size, index=0):
+    """
+    加载指定字体文件，按 (字体文件, 字号, 字体索引) 缓存，超出容量时淘汰最久未使用的条目。
+    加载失败时返回None，失败结果同样会被缓存。
+    """
+    key = (font_file, size, index)
+    with _lock:
+        if key in _font_cache:
+            _font_cache.move_to_end(key)
+            return _font_cache[key]
+
+    try:
+        font = ImageFont.truetype(font_file, size, index=index)
+    except (IOError, OSError, ValueError) as e:
+        print(f"✗ 无法加载字体文件: {font_file}, 错误: {str(e)}")
+        font = None
+
+    with _lock:
+        _font_cache[key] = font
+        _font_cache.move_to_end(key)
+        while len(_font_cache) > FONT_CACHE_SIZE:
+            _font_cache.popitem(last=False)
+    return font
+
+
+def get_default_font():
+    """
+    获取PIL默认字体（只创建一次）
+    """
+    global _default_font
+    with _lock:
+        if _default_font is None:
+            _default_font = ImageFont.load_default()
+        return _default_font
+
+
+def get_font(font_name, size, bold=False, italic=False):
+    """
+    获取指定名称、字号和样式的字体对象，无法加载时返回PIL默认字体
+    """
+    resolved = resolve_font(font_name, bold, italic)
+    if resolved:
+        font = load_font_file(resolved[0], size, resolved[1])
+        if font is not None:
+            return font
+    return get_default_font()
+
+
+def clear_font_cache():
+    """
+    清空字体对象缓存和字体解析结果（例如系统安装了新字体之后），下次使用时重新检查字体索引
+    """
+    global _default_font, _font_index
+    with _lock:
+        _font_cache.clear()
+        _resolved_fonts.clear()
+        _default_font = None
+        _font_index = None
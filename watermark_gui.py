@@ -1,14 +1,68 @@
+import io
 import os
 import sys
+import time
+# 启动计时从导入模块开始（--startup-profile）
+_IMPORT_START = time.perf_counter()
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, colorchooser
-from PIL import Image, ImageTk, ImageDraw, ImageFont
-import exifread
-from datetime import datetime
-import re
 import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import json
-import os
+from collections import OrderedDict
+from watermark_preview import PreviewCache, PreviewProxy
+from watermark_collection import ImageCollection
+from watermark_imagelist import VirtualImageList
+# PIL和图片处理模块（watermark_export、watermark_render、watermark_fonts等）导入较慢，
+# 在窗口第一次绘制之后或第一次使用时才导入
+
+# 预览渲染的帧间隔（毫秒），这段时间内的设置变化合并为一次渲染
+PREVIEW_FRAME_MS = 16
+
+# 后台生成缩略图的线程数，以及界面线程取回缩略图的间隔（毫秒）
+THUMBNAIL_WORKERS = max(2, min(8, os.cpu_count() or 1))
+THUMBNAIL_POLL_MS = 50
+
+# 内存中保留的列表缩略图数量上限，超出后淘汰最久未显示的缩略图（滚动回来时重新生成）
+THUMBNAIL_CACHE_SIZE = 1000
+
+# 导出时刷新进度条和状态栏的间隔（毫秒），工作线程的完成消息在这个间隔内批量处理
+PROGRESS_UPDATE_MS = 100
+
+# 等待后台读取字体列表时的检查间隔（毫秒）
+FONT_LIST_POLL_MS = 50
+
+# 窗口最小化启动等情况下收不到绘制事件，超过这个时间（毫秒）后同样继续初始化
+FIRST_PAINT_TIMEOUT_MS = 500
+
+# 没有找到系统字体时使用的字体列表
+DEFAULT_FONT_NAMES = ['Arial', 'Times New Roman', 'Courier New', 'Microsoft YaHei', 'SimSun', 'SimHei']
+
+
+class StartupProfile:
+    """
+    记录启动各阶段的耗时，启用时（--startup-profile）在所有延迟加载完成后输出
+    """
+
+    def __init__(self, enabled=False, start=None):
+        self.enabled = enabled
+        self.start = time.perf_counter() if start is None else start
+        self.last = self.start
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last, now - self.start))
+        self.last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        print("启动耗时:")
+        for phase, elapsed, total in self.phases:
+            print(f"  {phase:<12} {elapsed * 1000:8.1f} ms  (累计 {total * 1000:8.1f} ms)")
+
 
 # 确保中文显示正常
 if sys.platform == 'win32':
@@ -16,8 +70,11 @@ if sys.platform == 'win32':
     ctypes.windll.shcore.SetProcessDpiAwareness(1)
 
 class WatermarkApp:
-    def __init__(self, root):
+    def __init__(self, root, profile=None):
         self.root = root
+        self.profile = profile or StartupProfile()
+        # 设置面板在窗口第一次绘制后才创建，创建完成前不渲染预览、不保存设置
+        self.settings_ready = False
         self.root.title("图片日期水印工具")
         # 设置窗口尺寸，提供宽敞的操作空间
         self.root.geometry("1600x900")
@@ -50,15 +107,34 @@ class WatermarkApp:
         # 设置窗口背景
         self.root.configure(bg=self.colors['background'])
         
-        # 存储导入的图片路径
-        self.image_paths = []
-        # 存储缩略图
-        self.thumbnails = []
-        # 当前选中的图片索引用于预览
-        self.current_preview_index = -1
+        # 存储导入的图片路径（按导入顺序，每张图片有稳定的id）
+        self.image_paths = ImageCollection()
+        # 存储缩略图：图片id -> PhotoImage（无法生成时为None），按最近显示顺序排列
+        self.thumbnails = OrderedDict()
+        # 缩略图在后台线程池中生成：正在生成的图片id，以及生成结果队列
+        self.thumbnail_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+        self.thumbnail_pending = set()
+        self.thumbnail_results = queue.Queue()
+        self.thumbnail_placeholder = None
+        self._thumbnail_polling = False
+        # 磁盘缩略图缓存，再次打开相同的图片时不需要重新解码原图（第一次生成缩略图时创建）
+        self.thumbnail_cache = None
+        # 当前选中用于预览的图片id
+        self.current_preview_id = None
         # 预览窗口相关变量
         self.preview_image = None
         self.preview_photo = None
+        # 预览代理缓存（缩放后的图片、PhotoImage和水印日期），有内存上限
+        self.preview_cache = PreviewCache()
+        # 预览调度：等待中的渲染请求、正在后台加载的 (图片路径, 画布尺寸)、后台加载结果队列
+        self._preview_after_id = None
+        self._preview_loading = None
+        self.preview_results = queue.Queue()
+        self._preview_polling = False
+        # 预览图片由一个常驻的后台线程加载：只保留最新的请求，加载期间被取代的请求不会再解码
+        self._preview_request = None
+        self._preview_request_ready = threading.Condition()
+        self._preview_worker = None
         # 自定义水印位置变量
         self.custom_watermark_position = None  # 存储(x, y)坐标
         self.is_dragging_watermark = False     # 标记是否正在拖动水印
@@ -192,32 +268,87 @@ class WatermarkApp:
         self.right_scrollable_frame.bind("<MouseWheel>", _right_mousewheel)
         
         # 水印模板相关
-        self.templates = {}  # 存储所有水印模板
-        # 创建templates文件夹（如果不存在）
-        templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
-        if not os.path.exists(templates_dir):
-            os.makedirs(templates_dir)
-        self.template_file = os.path.join(templates_dir, 'watermark_templates.json')
-        self._load_all_templates()  # 加载已保存的模板
+        self.templates = {}  # 存储所有水印模板，窗口显示后再加载
+        self.template_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'watermark_templates.json')
         
         # 加载上次关闭时的设置
         self._load_settings()
         
-        # 启用拖拽功能
-        self.enable_drag_and_drop()
-        
-        # 创建主布局
+        # 创建主布局（图片列表、按钮和预览窗口），设置面板在窗口显示后再创建
         self.create_widgets()
         
         # 绑定窗口关闭事件，确保清理资源
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
-        # 为所有设置控件绑定事件，实现实时预览
+        # 窗口第一次绘制后再完成其余的初始化
+        self.status_var.set("正在加载...")
+        self._startup_pending = True
+        self._first_paint_binding = self.status_label.bind("<Expose>", self._on_first_paint)
+        self.root.after(FIRST_PAINT_TIMEOUT_MS, self._on_first_paint)
+        self.profile.mark("界面骨架")
+    
+    def _on_first_paint(self, event=None):
+        # 窗口已经显示，其余的初始化在界面空闲时进行
+        if not self._startup_pending:
+            return
+        self._startup_pending = False
+        self.status_label.unbind("<Expose>", self._first_paint_binding)
+        self.profile.mark("窗口显示")
+        self.root.after_idle(self.finish_startup)
+    
+    def finish_startup(self):
+        # 创建设置面板（会导入图片处理模块）、加载模板和上次的设置、启用拖放，并在后台读取字体列表
+        self.move_settings_to_right()
         self.bind_preview_events()
+        self.profile.mark("设置面板")
         
+        # 创建templates文件夹（如果不存在）并加载已保存的模板
+        os.makedirs(os.path.dirname(self.template_file), exist_ok=True)
+        self._load_all_templates()
+        self._update_template_combobox()
         # 如果有上次保存的设置，应用这些设置
-        if hasattr(self, 'last_settings') and self.last_settings:
+        if self.last_settings:
             self._apply_last_settings()
+        self.profile.mark("模板和设置")
+        
+        self.settings_ready = True
+        self.process_btn.config(state=tk.NORMAL)
+        self.status_var.set("就绪")
+        
+        # 启用拖拽功能（包括导入启动时通过命令行传入的图片）
+        self.enable_drag_and_drop()
+        self.profile.mark("拖放")
+        
+        self.load_font_list()
+        self.update_preview()
+    
+    def load_font_list(self):
+        # 在后台线程中读取字体索引（首次运行或字体目录变化时需要扫描字体文件），完成后填充字体下拉列表
+        results = queue.Queue()
+        
+        def worker():
+            try:
+                from watermark_fonts import list_font_families
+                results.put(list_font_families())
+            except Exception as e:
+                print(f"获取系统字体列表时出错: {e}")
+                results.put([])
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(FONT_LIST_POLL_MS, self.poll_font_list, results)
+    
+    def poll_font_list(self, results):
+        try:
+            font_names = results.get_nowait()
+        except queue.Empty:
+            self.root.after(FONT_LIST_POLL_MS, self.poll_font_list, results)
+            return
+        # 如果没有找到字体，使用默认字体列表
+        self.font_combo['values'] = font_names or DEFAULT_FONT_NAMES
+        self.profile.mark("字体列表")
+        self.profile.report()
+        # 字体索引就绪后按选择的字体重新绘制水印
+        self.update_preview()
         
     def setup_ttk_styles(self):
         # 设置ttk组件的样式
@@ -248,7 +379,12 @@ class WatermarkApp:
             # 添加提示文本，告知用户可以拖拽文件
             self.drag_hint = tk.Label(self.scrollable_frame, text="提示: 您可以直接将图片拖放到窗口中进行导入", 
                                      font=self.font_config['normal'], fg="gray")
-            self.drag_hint.pack(pady=5)
+            # 界面已经创建，提示文本放在左侧区域最上方
+            packed_widgets = self.scrollable_frame.pack_slaves()
+            if packed_widgets:
+                self.drag_hint.pack(pady=5, before=packed_widgets[0])
+            else:
+                self.drag_hint.pack(pady=5)
             
             # 在Windows上，当文件被拖放到应用程序窗口时，文件路径会作为命令行参数传递
             # 我们在应用启动时就检查是否有拖放的文件
@@ -314,8 +450,8 @@ class WatermarkApp:
             print(f"启用拖拽功能时出错: {e}")
     
     def create_widgets(self):
-        # 首先，将所有设置相关的UI元素从左侧移到右侧
-        self.move_settings_to_right()
+        # 首先创建图片列表、进度条和状态栏（设置面板在窗口显示后由 finish_startup 创建）
+        self.create_image_list()
         
         # 创建顶部按钮区域
         top_frame = tk.Frame(self.scrollable_frame, bg=self.colors['background'])
@@ -353,11 +489,11 @@ class WatermarkApp:
         clear_btn = create_styled_button(left_buttons_frame, "清空列表", self.clear_images, self.font_config['normal'])
         clear_btn.pack(side=tk.LEFT, padx=5)
         
-        # 开始处理按钮 - 强调样式
+        # 开始处理按钮 - 强调样式（设置面板创建后才可用）
         self.process_btn = tk.Button(top_frame, text="开始处理", command=self.start_processing, font=self.font_config['title'], width=15,
                                    bg=self.colors['accent'], fg='white', relief=tk.FLAT,
                                    activebackground=self.colors['accent'], activeforeground='white',
-                                   padx=5, pady=5)
+                                   padx=5, pady=5, state=tk.DISABLED)
         self.process_btn.pack(side=tk.RIGHT, padx=5)
         
 
@@ -425,6 +561,14 @@ class WatermarkApp:
             if 'output_folder' in settings: self.output_folder_var.set(settings['output_folder'])
             if 'format' in settings: self.format_var.set(settings['format'])
             if 'quality' in settings: self.quality_var.set(settings['quality'])
+            if 'output_format' in settings: self.output_format_var.set(settings['output_format'])
+            if 'output_quality' in settings: self.jpeg_quality_var.set(settings['output_quality'])
+            if 'encoder_preset' in settings: self.set_encoder_preset(settings['encoder_preset'])
+            if 'lossless_region' in settings: self.lossless_region_var.set(settings['lossless_region'])
+            if 'incremental' in settings: self.incremental_var.set(settings['incremental'])
+            if 'jobs' in settings: self.jobs_var.set(settings['jobs'])
+            if 'worker_mode' in settings: self.worker_mode_var.set(settings['worker_mode'])
+            if 'io_jobs' in settings: self.io_jobs_var.set(settings['io_jobs'])
             
             # 应用图片尺寸设置
             if 'scale' in settings: self.scale_var.set(settings['scale'])
@@ -443,6 +587,7 @@ class WatermarkApp:
             self.on_scale_change()
             self.on_naming_change()
             self.on_format_change()
+            self.update_quality_control_state()
             
         except Exception as e:
             print(f"应用上次设置时出错: {e}")
@@ -491,6 +636,14 @@ class WatermarkApp:
                 'output_folder': self.output_folder_var.get(),
                 'format': self.format_var.get(),
                 'quality': self.quality_var.get(),
+                'output_format': self.output_format_var.get(),
+                'output_quality': self.jpeg_quality_var.get(),
+                'encoder_preset': self.get_encoder_preset(),
+                'lossless_region': self.lossless_region_var.get(),
+                'incremental': self.incremental_var.get(),
+                'jobs': self.jobs_var.get(),
+                'worker_mode': self.worker_mode_var.get(),
+                'io_jobs': self.io_jobs_var.get(),
                 
                 # 图片尺寸设置
                 'scale': self.scale_var.get(),
@@ -570,7 +723,12 @@ class WatermarkApp:
             'text_color': self.text_color_var.get(),
             'opacity': self.opacity_var.get(),
             'text_type': self.text_type_var.get(),
-            'custom_text': self.custom_text_var.get()
+            'custom_text': self.custom_text_var.get(),
+            
+            # 输出格式和编码预设，如样张模板使用快速预设、网页模板使用小文件预设
+            'output_format': self.output_format_var.get(),
+            'output_quality': self.jpeg_quality_var.get(),
+            'encoder_preset': self.get_encoder_preset()
         }
         
         # 保存模板
@@ -607,9 +765,14 @@ class WatermarkApp:
         self.opacity_var.set(template_params['opacity'])
         self.text_type_var.set(template_params['text_type'])
         self.custom_text_var.set(template_params['custom_text'])
+        # 旧版本保存的模板没有输出设置，保持当前设置
+        if 'output_format' in template_params: self.output_format_var.set(template_params['output_format'])
+        if 'output_quality' in template_params: self.jpeg_quality_var.set(template_params['output_quality'])
+        if 'encoder_preset' in template_params: self.set_encoder_preset(template_params['encoder_preset'])
         
         # 更新相关UI状态
         self.on_text_type_change()
+        self.update_quality_control_state()
         self.update_preview()
         
         messagebox.showinfo("成功", f"已加载模板 '{template_name}'")
@@ -629,6 +792,9 @@ class WatermarkApp:
             messagebox.showinfo("成功", f"模板 '{template_name}' 已删除")
     
     def move_settings_to_right(self):
+        from watermark_export import WORKER_THREAD, WORKER_PROCESS, WORKER_PIPELINE, DEFAULT_IO_WORKERS, DEFAULT_ENCODER_PRESET
+        from watermark import get_auto_jobs
+        
         # 创建水印设置区域
         settings_frame = ttk.LabelFrame(self.right_scrollable_frame, text="水印设置", padding=(15, 10))
         settings_frame.pack(fill=tk.X, padx=10, pady=8)
@@ -674,45 +840,8 @@ class WatermarkApp:
         tk.Label(font_frame, text="选择字体:", font=self.font_config['normal'], width=10).pack(side=tk.LEFT, padx=5)
         self.font_var = tk.StringVar(value="Arial")
         
-        # 获取系统字体列表
-        import sys
-        import os
-        if sys.platform.startswith('win'):
-            try:
-                import winreg
-                # 从Windows注册表获取已安装字体
-                font_reg_path = r"SOFTWARE\Microsoft\Windows NT\CurrentVersion\Fonts"
-                with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, font_reg_path) as key:
-                    font_names = []
-                    i = 0
-                    while True:
-                        try:
-                            # 获取字体名称和文件名
-                            font_name, font_file, _ = winreg.EnumValue(key, i)
-                            # 提取字体名称（去掉后面的版本信息）
-                            font_base_name = font_name.split(' ')[0]
-                            if font_base_name and font_base_name not in font_names:
-                                font_names.append(font_base_name)
-                            i += 1
-                        except OSError:
-                            break
-                # 添加一些常见字体作为备选
-                common_fonts = ['Arial', 'Times New Roman', 'Courier New', 'Microsoft YaHei', 'SimSun', 'SimHei']
-                for font in common_fonts:
-                    if font not in font_names:
-                        font_names.append(font)
-                # 对字体列表进行排序
-                font_names.sort()
-            except Exception as e:
-                print(f"获取系统字体列表时出错: {e}")
-                # 如果出错，使用默认字体列表
-                font_names = ['Arial', 'Times New Roman', 'Courier New', 'Microsoft YaHei', 'SimSun', 'SimHei']
-        else:
-            # 非Windows系统，使用默认字体列表
-            font_names = ['Arial', 'Times New Roman', 'Courier New', 'Helvetica', 'Times', 'Courier']
-        
-        # 创建字体下拉列表
-        self.font_combo = ttk.Combobox(font_frame, textvariable=self.font_var, values=font_names, state="readonly", width=25)
+        # 创建字体下拉列表，系统字体列表由 load_font_list 在后台读取后填充
+        self.font_combo = ttk.Combobox(font_frame, textvariable=self.font_var, values=[self.font_var.get()], state="readonly", width=25)
         self.font_combo.pack(side=tk.LEFT, padx=5)
         
         # 字体样式设置
@@ -1058,55 +1187,102 @@ class WatermarkApp:
         
         tk.Label(output_format_frame, text="输出格式:", font=self.font_config['normal'], width=10).pack(side=tk.LEFT, padx=5)
         self.output_format_var = tk.StringVar(value="JPEG")
-        formats = ['JPEG', 'JPG', 'PNG']
+        formats = ['JPEG', 'JPG', 'PNG', 'WEBP']
         format_combo = ttk.Combobox(output_format_frame, textvariable=self.output_format_var, values=formats, state="readonly", width=15)
         format_combo.pack(side=tk.LEFT, padx=5)
         
         # 绑定格式变化事件，用于控制质量滑块的可用状态
-        format_combo.bind("<<ComboboxSelected>>", self.on_format_change)
+        format_combo.bind("<<ComboboxSelected>>", lambda event: self.update_quality_control_state())
         
-        # JPEG质量设置
+        # JPEG/WebP质量设置
         self.jpeg_quality_var = tk.IntVar(value=95)
-        self.quality_frame = tk.Frame(export_frame)
-        self.quality_frame.pack(fill=tk.X, pady=5)
+        output_quality_frame = tk.Frame(export_frame)
+        output_quality_frame.pack(fill=tk.X, pady=5)
         
-        self.quality_label = tk.Label(self.quality_frame, text="JPEG质量:", font=self.font_config['normal'], width=10)
+        self.quality_label = tk.Label(output_quality_frame, text="输出质量:", font=self.font_config['normal'], width=10)
         self.quality_label.pack(side=tk.LEFT, padx=5)
-        self.quality_scale = tk.Scale(self.quality_frame, from_=1, to=100, orient=tk.HORIZONTAL, 
+        self.quality_scale = tk.Scale(output_quality_frame, from_=1, to=100, orient=tk.HORIZONTAL, 
                                     variable=self.jpeg_quality_var, length=200)
         self.quality_scale.pack(side=tk.LEFT, padx=5)
-        self.quality_value_label = tk.Label(self.quality_frame, textvariable=self.jpeg_quality_var, 
+        self.quality_value_label = tk.Label(output_quality_frame, textvariable=self.jpeg_quality_var, 
                                           font=self.font_config['normal'], width=5)
         self.quality_value_label.pack(side=tk.LEFT, padx=5)
         
-        # 初始状态检查，确保只有JPEG/JPG格式时质量控制才可用
+        # 编码预设：快速适合样张，小文件适合网页发布，可随模板保存
+        encoder_preset_frame = tk.Frame(export_frame)
+        encoder_preset_frame.pack(fill=tk.X, pady=5)
+        
+        tk.Label(encoder_preset_frame, text="编码预设:", font=self.font_config['normal'], width=10).pack(side=tk.LEFT, padx=5)
+        # 编码预设映射 - 显示名称 -> watermark_export.ENCODER_PRESETS 中的预设名
+        self.encoder_preset_map = {
+            '默认': 'default',
+            '快速（样张）': 'fast',
+            '小文件（网页）': 'small',
+            '高保真': 'fidelity'
+        }
+        self.encoder_preset_var = tk.StringVar()
+        self.set_encoder_preset(DEFAULT_ENCODER_PRESET)
+        encoder_preset_combo = ttk.Combobox(encoder_preset_frame, textvariable=self.encoder_preset_var,
+                                            values=list(self.encoder_preset_map), state="readonly", width=15)
+        encoder_preset_combo.pack(side=tk.LEFT, padx=5)
+        
+        # JPEG无损区域模式（默认关闭）：只重新编码水印覆盖的区域，其余部分不再次压缩，避免画质损失（需要安装jpegtran）
+        lossless_region_frame = tk.Frame(export_frame)
+        lossless_region_frame.pack(fill=tk.X, pady=5)
+        
+        tk.Label(lossless_region_frame, text="无损区域:", font=self.font_config['normal'], width=10).pack(side=tk.LEFT, padx=5)
+        self.lossless_region_var = tk.BooleanVar(value=False)
+        self.lossless_region_check = tk.Checkbutton(lossless_region_frame, text="JPEG只重新编码水印区域", variable=self.lossless_region_var,
+                                                    font=self.font_config['normal'], command=self.update_quality_control_state)
+        self.lossless_region_check.pack(side=tk.LEFT, padx=5)
+        tk.Label(lossless_region_frame, text="（原图为JPEG且不调整尺寸时）", font=self.font_config['small']).pack(side=tk.LEFT, padx=5)
+        # 启用无损区域模式时提示质量设置对水印区域不起作用
+        self.lossless_region_hint = tk.Label(export_frame, text="", font=self.font_config['small'], anchor=tk.W, justify=tk.LEFT)
+        self.lossless_region_hint.pack(fill=tk.X, padx=5)
+        
+        # 增量处理设置：跳过已用相同设置处理过且未变化的图片
+        incremental_frame = tk.Frame(export_frame)
+        incremental_frame.pack(fill=tk.X, pady=5)
+        
+        tk.Label(incremental_frame, text="增量处理:", font=self.font_config['normal'], width=10).pack(side=tk.LEFT, padx=5)
+        self.incremental_var = tk.BooleanVar(value=False)
+        self.incremental_check = tk.Checkbutton(incremental_frame, text="跳过已处理且未变化的图片", variable=self.incremental_var, font=self.font_config['normal'])
+        self.incremental_check.pack(side=tk.LEFT, padx=10)
+        
+        # 并行处理设置：同时处理的图片数量，以及使用线程还是进程
+        jobs_frame = tk.Frame(export_frame)
+        jobs_frame.pack(fill=tk.X, pady=5)
+        
+        tk.Label(jobs_frame, text="并行处理:", font=self.font_config['normal'], width=10).pack(side=tk.LEFT, padx=5)
+        self.jobs_var = tk.IntVar(value=get_auto_jobs())
+        self.jobs_spinbox = tk.Spinbox(jobs_frame, from_=1, to=max(64, os.cpu_count() or 1), textvariable=self.jobs_var, width=5)
+        self.jobs_spinbox.pack(side=tk.LEFT, padx=5)
+        self.worker_mode_var = tk.StringVar(value=WORKER_THREAD)
+        tk.Radiobutton(jobs_frame, text="线程", variable=self.worker_mode_var, value=WORKER_THREAD, font=self.font_config['normal']).pack(side=tk.LEFT, padx=5)
+        tk.Radiobutton(jobs_frame, text="进程", variable=self.worker_mode_var, value=WORKER_PROCESS, font=self.font_config['normal']).pack(side=tk.LEFT, padx=5)
+        tk.Radiobutton(jobs_frame, text="流水线", variable=self.worker_mode_var, value=WORKER_PIPELINE, font=self.font_config['normal']).pack(side=tk.LEFT, padx=5)
+        
+        # 流水线模式下读取和写入文件的线程数（网络共享或机械硬盘上可适当增大）
+        io_jobs_frame = tk.Frame(export_frame)
+        io_jobs_frame.pack(fill=tk.X, pady=5)
+        
+        tk.Label(io_jobs_frame, text="读写线程:", font=self.font_config['normal'], width=10).pack(side=tk.LEFT, padx=5)
+        self.io_jobs_var = tk.IntVar(value=DEFAULT_IO_WORKERS)
+        self.io_jobs_spinbox = tk.Spinbox(io_jobs_frame, from_=1, to=64, textvariable=self.io_jobs_var, width=5)
+        self.io_jobs_spinbox.pack(side=tk.LEFT, padx=5)
+        tk.Label(io_jobs_frame, text="（仅流水线模式）", font=self.font_config['small']).pack(side=tk.LEFT, padx=5)
+        
+        # 初始状态检查，确保只有JPEG/JPG/WEBP格式时质量控制才可用
         self.update_quality_control_state()
-        
+    
+    def create_image_list(self):
         # 创建图片列表区域
         list_frame = ttk.LabelFrame(self.scrollable_frame, text="已导入图片", padding=(10, 5))
         list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         
-        # 创建滚动区域（使用不同的变量名避免覆盖主区域的canvas和scrollable_frame）
-        self.list_canvas = tk.Canvas(list_frame)
-        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.list_canvas.yview)
-        hscrollbar = ttk.Scrollbar(list_frame, orient="horizontal", command=self.list_canvas.xview)
-        self.list_scrollable_frame = tk.Frame(self.list_canvas)
-        
-        self.list_scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.list_canvas.configure(
-                scrollregion=self.list_canvas.bbox("all")
-            )
-        )
-        
-
-        
-        self.list_canvas.create_window((0, 0), window=self.list_scrollable_frame, anchor="nw")
-        self.list_canvas.configure(yscrollcommand=scrollbar.set, xscrollcommand=hscrollbar.set)
-        
-        hscrollbar.pack(side="bottom", fill="x")
-        scrollbar.pack(side="right", fill="y")
-        self.list_canvas.pack(side="left", fill="both", expand=True)
+        # 虚拟化列表：只为可见的行创建控件，滚动时复用
+        self.image_list = VirtualImageList(list_frame, self.image_paths, self.select_image_for_preview,
+                                           self.remove_image, self.get_list_thumbnail, self.font_config['normal'])
         
         # 进度条
         progress_frame = tk.Frame(self.scrollable_frame)
@@ -1149,63 +1325,98 @@ class WatermarkApp:
                 messagebox.showinfo("提示", f"所选文件夹中未找到支持的图片文件")
     
     def add_images(self, file_paths):
-        # 添加图片到列表
+        # 添加图片到列表，已导入的图片跳过
         for file_path in file_paths:
-            if file_path not in self.image_paths:
-                self.image_paths.append(file_path)
-                self.display_image(file_path)
+            self.image_paths.add(file_path)
+        self.image_list.refresh()
         self.update_status()
     
-    def display_image(self, file_path):
-        # 显示图片缩略图
+    def get_list_thumbnail(self, image_id, file_path):
+        # 列表显示某一行时调用：返回已生成的缩略图，尚未生成时返回占位图并在后台生成
+        if image_id in self.thumbnails:
+            self.thumbnails.move_to_end(image_id)
+            return self.thumbnails[image_id]
+        self.request_thumbnail(image_id, file_path)
+        if self.thumbnail_placeholder is None:
+            from PIL import ImageTk
+            from watermark_thumbs import make_placeholder
+            self.thumbnail_placeholder = ImageTk.PhotoImage(make_placeholder())
+        return self.thumbnail_placeholder
+    
+    def request_thumbnail(self, image_id, file_path):
+        # 提交后台缩略图生成任务，完成后由界面线程更新对应的行
+        if image_id in self.thumbnail_pending:
+            return
+        if self.thumbnail_cache is None:
+            from watermark_thumbs import ThumbnailCache
+            self.thumbnail_cache = ThumbnailCache()
+        self.thumbnail_pending.add(image_id)
+        future = self.thumbnail_executor.submit(self.load_list_thumbnail, image_id, file_path)
+        future.add_done_callback(lambda f, image_id=image_id: self.thumbnail_results.put((image_id, f)))
+        if not self._thumbnail_polling:
+            self._thumbnail_polling = True
+            self.root.after(THUMBNAIL_POLL_MS, self.poll_thumbnails)
+    
+    def load_list_thumbnail(self, image_id, file_path):
+        # 在后台线程中运行：快速滚动时已经滚出可见区域的图片不再生成，返回None
+        if image_id not in self.image_list.visible_ids():
+            return None
+        return self.thumbnail_cache.load(file_path)
+    
+    def poll_thumbnails(self):
+        # 在界面线程中取出已生成的缩略图并显示，没有待处理的缩略图时停止轮询
+        from PIL import ImageTk
         try:
-            # 打开图片并创建缩略图
-            img = Image.open(file_path)
-            img.thumbnail((100, 100))
-            thumbnail = ImageTk.PhotoImage(img)
-            
-            # 保存缩略图引用
-            self.thumbnails.append(thumbnail)
-            
-            # 创建图片项
-            item_frame = tk.Frame(self.list_scrollable_frame, bd=1, relief=tk.RAISED, cursor="hand2")
-            item_frame.pack(fill=tk.X, padx=5, pady=5)
-            
-            # 为图片项添加点击事件
-            img_index = len(self.image_paths) - 1  # 当前图片的索引
-            item_frame.bind("<Button-1>", lambda event, index=img_index: self.select_image_for_preview(index))
-            
-            # 添加缩略图
-            img_label = tk.Label(item_frame, image=thumbnail, cursor="hand2")
-            img_label.pack(side=tk.LEFT, padx=5, pady=5)
-            img_label.bind("<Button-1>", lambda event, index=img_index: self.select_image_for_preview(index))
-            
-            # 添加文件名和路径
-            file_name = os.path.basename(file_path)
-            path_label = tk.Label(item_frame, text=file_path, font=self.font_config['normal'], wraplength=600, justify=tk.LEFT, cursor="hand2")
-            path_label.pack(side=tk.LEFT, padx=5, pady=5, fill=tk.X, expand=True)
-            path_label.bind("<Button-1>", lambda event, index=img_index: self.select_image_for_preview(index))
-            
-            # 添加删除按钮
-            delete_btn = tk.Button(item_frame, text="删除", command=lambda path=file_path, frame=item_frame: self.remove_image(path, frame), font=self.font_config['normal'], width=8)
-            delete_btn.pack(side=tk.RIGHT, padx=5, pady=5)
-            
-        except Exception as e:
-            messagebox.showerror("错误", f"无法显示图片 {file_path}: {str(e)}")
+            while True:
+                image_id, future = self.thumbnail_results.get_nowait()
+                self.thumbnail_pending.discard(image_id)
+                file_path = self.image_paths.get(image_id)
+                if file_path is None:
+                    # 图片已从列表中删除
+                    continue
+                try:
+                    image = future.result()
+                except Exception as e:
+                    print(f"生成缩略图时出错 {file_path}: {e}")
+                    thumbnail = None
+                else:
+                    if image is None:
+                        # 提交时已滚出可见区域，如果又滚动回来则重新生成
+                        if image_id in self.image_list.visible_ids():
+                            self.request_thumbnail(image_id, file_path)
+                        continue
+                    thumbnail = ImageTk.PhotoImage(image)
+                # 保存缩略图引用，超出上限时淘汰最久未显示的缩略图
+                self.thumbnails[image_id] = thumbnail
+                while len(self.thumbnails) > THUMBNAIL_CACHE_SIZE:
+                    self.thumbnails.popitem(last=False)
+                self.image_list.refresh_item(image_id)
+        except queue.Empty:
+            pass
+        if self.thumbnail_pending:
+            self.root.after(THUMBNAIL_POLL_MS, self.poll_thumbnails)
+        else:
+            self._thumbnail_polling = False
     
-    def remove_image(self, file_path, frame):
-        # 从列表中删除图片
-        if file_path in self.image_paths:
-            self.image_paths.remove(file_path)
-        frame.destroy()
+    def remove_image(self, image_id):
+        # 从列表中删除图片，其他图片的id不受影响
+        file_path = self.image_paths.remove(image_id)
+        if file_path is None:
+            return
+        self.preview_cache.discard(file_path)
+        self.thumbnails.pop(image_id, None)
+        if self.current_preview_id == image_id:
+            self.current_preview_id = None
+        self.image_list.refresh()
         self.update_status()
     
     def clear_images(self):
-        # 清空所有图片
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
+        # 清空所有图片，仍在生成的缩略图完成后会被丢弃（id不会重复使用）
         self.image_paths.clear()
         self.thumbnails.clear()
+        self.preview_cache.clear()
+        self.current_preview_id = None
+        self.image_list.refresh()
         self.update_status()
     
     def select_output_folder(self):
@@ -1239,6 +1450,7 @@ class WatermarkApp:
     
     def start_processing(self):
         # 开始处理图片
+        from watermark_export import DEFAULT_IO_WORKERS
         if not self.image_paths:
             messagebox.showinfo("提示", "请先导入图片")
             return
@@ -1259,22 +1471,63 @@ class WatermarkApp:
         self.process_btn.config(state=tk.DISABLED)
         self.status_var.set("正在处理图片...")
         
+        # 在界面线程中捕获设置快照，导出线程只使用快照，不再访问Tk变量
+        settings = self.capture_render_settings()
+        
+        try:
+            jobs = max(1, int(self.jobs_var.get()))
+        except (tk.TclError, ValueError):
+            jobs = 1
+        try:
+            io_jobs = max(1, int(self.io_jobs_var.get()))
+        except (tk.TclError, ValueError):
+            io_jobs = DEFAULT_IO_WORKERS
+        worker_mode = self.worker_mode_var.get()
+        
+        # 工作线程通过队列报告每张图片的结果，界面线程定时取出并更新进度
+        self.export_queue = queue.Queue()
+        self.export_total = len(self.image_paths)
+        self.export_done = 0
+        self.export_start_time = time.monotonic()
+        self.progress_var.set(0)
+        
         # 在新线程中处理图片
-        thread = threading.Thread(target=self.process_images)
+        thread = threading.Thread(target=self.process_images,
+                                  args=(list(self.image_paths), output_folder, settings, self.incremental_var.get(), jobs, worker_mode, io_jobs))
         thread.daemon = True
         thread.start()
+        self.root.after(PROGRESS_UPDATE_MS, self.poll_export_progress)
     
 
         
+    def get_encoder_preset(self):
+        # 返回当前选择的编码预设名
+        return self.encoder_preset_map.get(self.encoder_preset_var.get(), 'default')
+    
+    def set_encoder_preset(self, preset):
+        # 按预设名选择编码预设，未知的预设名按默认预设处理
+        for label, name in self.encoder_preset_map.items():
+            if name == preset:
+                self.encoder_preset_var.set(label)
+                return
+        self.encoder_preset_var.set(next(iter(self.encoder_preset_map)))
+        
     def update_quality_control_state(self):
-        # 根据当前选择的输出格式，设置质量控制UI的可用状态
-        is_jpeg = self.output_format_var.get() in ['JPEG', 'JPG']
-        state = 'normal' if is_jpeg else 'disabled'
+        # 根据当前选择的输出格式，设置质量控制UI的可用状态（PNG为无损格式，不使用质量设置）
+        is_lossy = self.output_format_var.get() in ['JPEG', 'JPG', 'WEBP']
+        state = 'normal' if is_lossy else 'disabled'
         
         # 更新UI元素状态
         self.quality_label.config(state=state)
         self.quality_scale.config(state=state)
         self.quality_value_label.config(state=state)
+        # 无损区域模式只用于JPEG输出
+        is_jpeg = self.output_format_var.get() in ['JPEG', 'JPG']
+        self.lossless_region_check.config(state='normal' if is_jpeg else 'disabled')
+        if is_jpeg and self.lossless_region_var.get():
+            self.lossless_region_hint.config(text="无损区域模式下水印区域沿用原图的量化表，输出质量设置只用于无法使用该模式的图片")
+        else:
+            self.lossless_region_hint.config(text="")
         
     def update_resize_control_state(self):
         # 根据当前选择的缩放方式，设置尺寸控制UI的可用状态
@@ -1299,47 +1552,90 @@ class WatermarkApp:
         # 更新预览
         self.update_preview()
         
-    def process_images(self):
-        # 处理所有图片
-        success_count = 0
-        fail_count = 0
-        
-        for i, img_path in enumerate(self.image_paths):
-            try:
-                # 处理图片
-                current_position = self.position_var.get()
-                print(f"process_images中获取position_var: {current_position}")
-                success = self.add_watermark_to_image(
-                    img_path,
-                    self.output_folder_var.get(),
-                    self.font_size_var.get(),
-                    self.text_color_var.get(),
-                    'white',  # 背景颜色默认值（不再使用）
-                    current_position,
-                    self.output_format_var.get(),
-                    self.jpeg_quality_var.get(),
-                    self.resize_method_map.get(self.resize_method_var.get(), "none"),
-                    self.width_var.get(),
-                    self.height_var.get(),
-                    self.percent_var.get()
-                )
-                
-                if success:
-                    success_count += 1
+    def capture_render_settings(self):
+        # 在界面线程中读取所有水印和导出设置，生成不可变的设置快照供导出线程使用
+        from watermark_export import RenderSettings
+        return RenderSettings(
+            text_type=self.text_type_var.get(),
+            custom_text=self.custom_text_var.get(),
+            font=self.font_var.get(),
+            font_size=self.font_size_var.get(),
+            bold=self.bold_var.get(),
+            italic=self.italic_var.get(),
+            text_color=self.text_color_var.get(),
+            opacity=self.opacity_var.get(),
+            position=self.position_var.get(),
+            custom_position=tuple(self.custom_watermark_position) if self.custom_watermark_position else None,
+            stroke=self.stroke_var.get(),
+            stroke_width=self.stroke_width_var.get(),
+            stroke_color=self.stroke_color_var.get(),
+            shadow=self.shadow_var.get(),
+            shadow_offset=self.shadow_offset_var.get(),
+            shadow_color=self.shadow_color_var.get(),
+            naming=self.naming_var.get(),
+            prefix=self.prefix_var.get(),
+            suffix=self.suffix_var.get(),
+            output_format=self.output_format_var.get(),
+            quality=self.jpeg_quality_var.get(),
+            encoder_preset=self.get_encoder_preset(),
+            lossless_region=self.lossless_region_var.get(),
+            resize_method=self.resize_method_map.get(self.resize_method_var.get(), "none"),
+            target_width=self.width_var.get(),
+            target_height=self.height_var.get(),
+            scale_percent=self.percent_var.get()
+        )
+    
+    def process_images(self, image_paths, output_dir, settings, incremental, jobs, worker_mode, io_jobs):
+        # 处理所有图片（在工作线程中运行，只使用开始处理时捕获的设置快照，不访问Tk）
+        # 由线程池、进程池或分阶段流水线并行处理，每张图片的结果放入队列，由界面线程取出
+        from watermark_export import export_images
+        counts = (0, 0, 0)
+        try:
+            counts = export_images(image_paths, output_dir, settings, jobs, worker_mode, incremental,
+                                   on_result=lambda image_path, status: self.export_queue.put(status), io_jobs=io_jobs)
+        except Exception as e:
+            print(f"批量处理图片时出错: {e}")
+        finally:
+            # 处理完成（队列中的最后一条消息）
+            self.export_queue.put(counts)
+    
+    def poll_export_progress(self):
+        # 在界面线程中取出队列中已完成的结果，按固定间隔更新进度条、状态栏和预计剩余时间
+        from watermark_export import EXPORT_SUCCESS, EXPORT_FAILED, EXPORT_SKIPPED
+        counts = None
+        try:
+            while True:
+                message = self.export_queue.get_nowait()
+                if message in (EXPORT_SUCCESS, EXPORT_FAILED, EXPORT_SKIPPED):
+                    self.export_done += 1
                 else:
-                    fail_count += 1
-                
-            except Exception as e:
-                fail_count += 1
-                print(f"处理图片时出错 {img_path}: {str(e)}")
-            
-            # 更新进度条
-            progress = (i + 1) / len(self.image_paths) * 100
-            self.progress_var.set(progress)
-            self.root.update_idletasks()
+                    counts = message
+        except queue.Empty:
+            pass
+        
+        if counts is not None:
+            self.progress_var.set(100)
+            self.process_complete(*counts)
+            return
         
-        # 处理完成
-        self.root.after(0, lambda: self.process_complete(success_count, fail_count))
+        if self.export_total:
+            self.progress_var.set(self.export_done / self.export_total * 100)
+        status = f"正在处理图片... {self.export_done}/{self.export_total}"
+        elapsed = time.monotonic() - self.export_start_time
+        if self.export_done:
+            remaining = elapsed / self.export_done * (self.export_total - self.export_done)
+            status += f"，预计剩余 {self.format_duration(remaining)}"
+        self.status_var.set(status)
+        self.root.after(PROGRESS_UPDATE_MS, self.poll_export_progress)
+    
+    def format_duration(self, seconds):
+        # 将秒数格式化为便于阅读的时长
+        seconds = int(round(seconds))
+        if seconds >= 3600:
+            return f"{seconds // 3600}小时{seconds % 3600 // 60}分"
+        if seconds >= 60:
+            return f"{seconds // 60}分{seconds % 60}秒"
+        return f"{seconds}秒"
     
     def check_for_dropped_files_at_startup(self):
         # 检查启动时是否有文件被拖放到应用程序
@@ -1364,15 +1660,21 @@ class WatermarkApp:
                 self.add_images(valid_image_paths)
                 
     def on_closing(self):
-        # 保存设置
-        self._save_settings()
+        # 保存设置（设置面板尚未创建时没有可保存的设置）
+        if self.settings_ready:
+            self._save_settings()
+        # 取消尚未开始的缩略图任务，避免退出时等待
+        self.thumbnail_executor.shutdown(wait=False, cancel_futures=True)
         # 销毁窗口
         self.root.destroy()
             
-    def process_complete(self, success_count, fail_count):
+    def process_complete(self, success_count, fail_count, skipped_count=0):
         # 处理完成后的操作
         self.process_btn.config(state=tk.NORMAL)
-        self.status_var.set(f"处理完成: 成功 {success_count} 张，失败 {fail_count} 张")
+        if skipped_count:
+            self.status_var.set(f"处理完成: 成功 {success_count} 张，失败 {fail_count} 张，跳过未变化的图片 {skipped_count} 张")
+        else:
+            self.status_var.set(f"处理完成: 成功 {success_count} 张，失败 {fail_count} 张")
         
         if success_count > 0:
             if messagebox.askyesno("处理完成", f"成功处理 {success_count} 张图片，失败 {fail_count} 张图片\n是否打开输出文件夹？"):
@@ -1384,96 +1686,15 @@ class WatermarkApp:
                 else:  # Linux
                     os.system(f'xdg-open "{self.output_folder_var.get()}"')
     
-    def get_exif_datetime(self, image_path):
-        # 从图片文件中读取EXIF信息中的拍摄时间
-        try:
-            with open(image_path, 'rb') as f:
-                tags = exifread.process_file(f)
-                # 尝试获取不同格式的日期时间标签
-                datetime_tags = ['EXIF DateTimeOriginal', 'EXIF DateTimeDigitized', 'Image DateTime']
-                for tag in datetime_tags:
-                    if tag in tags:
-                        datetime_str = str(tags[tag])
-                        # 解析日期时间字符串，通常格式为 'YYYY:MM:DD HH:MM:SS'
-                        try:
-                            dt = datetime.strptime(datetime_str, '%Y:%m:%d %H:%M:%S')
-                            return dt.strftime('%Y-%m-%d')  # 返回年月日格式
-                        except ValueError:
-                            continue
-                # 如果没有找到有效的EXIF日期时间，返回None
-                return None
-        except Exception as e:
-            print(f"读取EXIF信息时出错 {image_path}: {e}")
-            return None
+    def get_image_date(self, image_path):
+        # 获取图片的水印日期：优先使用EXIF拍摄日期，否则使用文件修改时间
+        from watermark_export import get_image_date
+        return get_image_date(image_path)
     
     def parse_color(self, color_str, opacity=100):
-        # 解析颜色字符串，opacity参数控制透明度(0-100%)
-        # 注意：opacity值越大，透明度越高
-        print(f"解析颜色: '{color_str}', 透明度设置: {opacity}%")
-        
-        # 预定义颜色映射 - 增加更多常见颜色
-        color_map = {
-            'black': (0, 0, 0, 255),
-            'white': (255, 255, 255, 255),
-            'red': (255, 0, 0, 255),
-            'green': (0, 255, 0, 255),
-            'blue': (0, 0, 255, 255),
-            'yellow': (255, 255, 0, 255),
-            'cyan': (0, 255, 255, 255),
-            'magenta': (255, 0, 255, 255),
-            'gray': (128, 128, 128, 255),
-            'grey': (128, 128, 128, 255),
-            'orange': (255, 165, 0, 255),
-            'purple': (128, 0, 128, 255),
-            'brown': (165, 42, 42, 255),
-            'pink': (255, 192, 203, 255)
-        }
-        
-        # 检查是否为预定义颜色
-        if color_str.lower() in color_map:
-            r, g, b, a = color_map[color_str.lower()]
-            # 应用透明度：opacity值越大，透明度越高
-            a = int(a * (100 - opacity) / 100)
-            print(f"使用预定义颜色: {color_str} -> RGBA: ({r}, {g}, {b}, {a})")
-            return (r, g, b, a)
-        
-        # 检查是否为十六进制颜色
-        hex_pattern = r'^#([0-9a-fA-F]{6})([0-9a-fA-F]{2})?$'
-        match = re.match(hex_pattern, color_str)
-        if match:
-            rgb_hex = match.group(1)
-            alpha_hex = match.group(2) or 'FF'
-            r = int(rgb_hex[0:2], 16)
-            g = int(rgb_hex[2:4], 16)
-            b = int(rgb_hex[4:6], 16)
-            a = int(alpha_hex, 16)
-            # 应用透明度：opacity值越大，透明度越高
-            a = int(a * (100 - opacity) / 100)
-            print(f"使用十六进制颜色: {color_str} -> RGBA: ({r}, {g}, {b}, {a})")
-            return (r, g, b, a)
-        
-        # 检查是否为RGB/RGBA元组格式
-        tuple_pattern = r'^\((\d{1,3}),(\d{1,3}),(\d{1,3})(?:,(\d{1,3}))?\)$'
-        match = re.match(tuple_pattern, color_str)
-        if match:
-            r = int(match.group(1))
-            g = int(match.group(2))
-            b = int(match.group(3))
-            a = int(match.group(4)) if match.group(4) else 255
-            # 确保值在有效范围内
-            r = max(0, min(255, r))
-            g = max(0, min(255, g))
-            b = max(0, min(255, b))
-            a = max(0, min(255, a))
-            # 应用透明度：opacity值越大，透明度越高
-            a = int(a * (100 - opacity) / 100)
-            print(f"使用RGB元组颜色: {color_str} -> RGBA: ({r}, {g}, {b}, {a})")
-            return (r, g, b, a)
-        
-        # 默认返回黑色，但使用与前面一致的透明度计算方式
-        print(f"警告: 无法解析颜色 '{color_str}'，使用默认黑色")
-        # 统一透明度计算方式
-        return (0, 0, 0, int(255 * (100 - opacity) / 100))
+        # 解析颜色字符串，opacity参数控制透明度(0-100%)，值越大透明度越高
+        from watermark_export import parse_color
+        return parse_color(color_str, opacity)
     
     def bind_preview_events(self):
         # 为所有水印设置控件绑定事件，实现实时预览
@@ -1510,51 +1731,36 @@ class WatermarkApp:
         # 水印类型变化已在on_text_type_change中处理
         # 自定义文本变化已在绑定中处理
     
-    def select_image_for_preview(self, index):
+    def select_image_for_preview(self, image_id):
         # 选择图片进行预览
-        if 0 <= index < len(self.image_paths):
-            self.current_preview_index = index
+        if self.image_paths.get(image_id) is not None:
+            self.current_preview_id = image_id
+            # 只在选中图片时检查文件是否被修改，渲染每一帧时直接使用缓存
+            self.preview_cache.validate(self.image_paths.get(image_id))
             # 高亮显示选中的图片项
-            self.highlight_selected_item(index)
+            self.image_list.set_selected(image_id)
             # 更新预览
             self.update_preview()
     
-    def highlight_selected_item(self, index):
-        # 高亮显示选中的图片项
-        children = self.scrollable_frame.winfo_children()
-        for i, child in enumerate(children):
-            if i == index:
-                # 使用try-except处理ttk组件和普通组件的差异
-                try:
-                    child.config(bg="#e0e0e0")  # 尝试设置普通tk组件的背景色
-                except tk.TclError:
-                    # 如果是ttk组件，使用style方法（或其他适合的方式）
-                    try:
-                        child.state(['selected'])
-                    except:
-                        pass  # 忽略无法设置选中状态的组件
-            else:
-                # 未选中状态
-                try:
-                    child.config(bg=self.scrollable_frame.cget("bg"))  # 普通tk组件
-                except tk.TclError:
-                    # ttk组件
-                    try:
-                        child.state(['!selected'])
-                    except:
-                        pass  # 忽略无法设置状态的组件
-    
     def update_preview(self):
-        # 更新预览窗口
-        if self.current_preview_index < 0 or self.current_preview_index >= len(self.image_paths):
+        # 请求更新预览：同一帧内的多次请求合并为一次渲染，滑块拖动时不会积压重绘
+        if self._preview_after_id is None:
+            self._preview_after_id = self.root.after(PREVIEW_FRAME_MS, self._run_scheduled_preview)
+    
+    def _run_scheduled_preview(self):
+        self._preview_after_id = None
+        if self.is_dragging_watermark:
+            # 拖动水印时不重绘，松开鼠标后会再次请求更新
+            return
+        self.render_preview()
+    
+    def render_preview(self):
+        # 渲染预览窗口（设置面板创建完成后才能渲染水印）
+        image_path = self.image_paths.get(self.current_preview_id)
+        if image_path is None or not self.settings_ready:
             return
         
         try:
-            image_path = self.image_paths[self.current_preview_index]
-            # 获取原始图片和水印文本
-            img = Image.open(image_path)
-            width, height = img.size
-            
             # 获取画布尺寸
             canvas_width = self.preview_canvas.winfo_width()
             canvas_height = self.preview_canvas.winfo_height()
@@ -1564,24 +1770,30 @@ class WatermarkApp:
                 canvas_width = 800
             if canvas_height < 100:  # 避免初始高度为0
                 canvas_height = 600
+            canvas_size = (canvas_width, canvas_height)
             
-            # 计算缩放比例，保持原图比例
-            ratio = min(canvas_width / width, canvas_height / height)
-            new_width = int(width * ratio)
-            new_height = int(height * ratio)
-            
-            # 调整图像大小
-            resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-            self.preview_photo = ImageTk.PhotoImage(resized_img)
-            
-            # 清除画布并显示新图像
-            self.preview_canvas.delete("all")
+            # 缩放后的图片、PhotoImage和水印日期按图片缓存，调整水印设置时只需重绘水印
+            proxy = self.preview_cache.get(image_path, canvas_size)
+            if proxy is None:
+                # 解码和缩放原图超出一帧的时间预算，交给后台线程，完成后再次渲染
+                self.load_preview_proxy(image_path, canvas_size)
+                return
+            width, height = proxy.orig_size
+            new_width, new_height = proxy.image.size
             x = (canvas_width - new_width) // 2
             y = (canvas_height - new_height) // 2
-            self.preview_canvas.create_image(x, y, image=self.preview_photo, anchor=tk.NW, tags="image")
+            
+            if self.preview_photo is proxy.photo and self.preview_canvas.find_withtag("image"):
+                # 画布上已经是这张图片，只删除旧的水印
+                self.preview_canvas.delete("watermark", "watermark_transparent")
+            else:
+                # 清除画布并显示新图像
+                self.preview_photo = proxy.photo
+                self.preview_canvas.delete("all")
+                self.preview_canvas.create_image(x, y, image=self.preview_photo, anchor=tk.NW, tags="image")
             
             # 绘制可拖动的水印文本
-            self.draw_draggable_watermark(x, y, ratio, width, height)
+            self.draw_draggable_watermark(x, y, proxy.ratio, width, height, proxy.date)
             
             # 绑定鼠标事件以支持拖动
             self.preview_canvas.bind("<Button-1>", self.on_watermark_click)
@@ -1596,69 +1808,116 @@ class WatermarkApp:
                                           text=f"预览失败: {str(e)}", 
                                           font=self.font_config['normal'], fill="red")
     
-    def draw_draggable_watermark(self, img_x, img_y, ratio, orig_width, orig_height):
+    def load_preview_proxy(self, image_path, canvas_size):
+        # 在后台线程中解码并缩放预览图片，同一图片和画布尺寸只加载一次
+        key = (image_path, canvas_size)
+        if self._preview_loading == key:
+            return
+        # 新的请求取代正在加载的请求，旧请求的结果到达后被丢弃
+        self._preview_loading = key
+        if not self.preview_canvas.find_withtag("image"):
+            self.preview_canvas.delete("all")
+            self.preview_canvas.create_text(canvas_size[0] // 2, canvas_size[1] // 2, text="正在加载预览...",
+                                            font=self.font_config['normal'], tags="loading")
+        
+        with self._preview_request_ready:
+            self._preview_request = key
+            self._preview_request_ready.notify()
+        if self._preview_worker is None:
+            self._preview_worker = threading.Thread(target=self._preview_worker_loop)
+            self._preview_worker.daemon = True
+            self._preview_worker.start()
+        if not self._preview_polling:
+            self._preview_polling = True
+            self.root.after(PREVIEW_FRAME_MS, self.poll_preview_results)
+    
+    def _preview_worker_loop(self):
+        # 后台线程：每次取出最新的加载请求，同一时间只解码一张预览图片
+        while True:
+            with self._preview_request_ready:
+                while self._preview_request is None:
+                    self._preview_request_ready.wait()
+                key = self._preview_request
+                self._preview_request = None
+            try:
+                result = self.load_preview_image(*key)
+            except Exception as e:
+                result = e
+            self.preview_results.put((key, result))
+    
+    def poll_preview_results(self):
+        # 在界面线程中取出后台加载完成的预览图片，创建PhotoImage并放入缓存
+        from PIL import ImageTk
+        try:
+            while True:
+                key, result = self.preview_results.get_nowait()
+                if key != self._preview_loading:
+                    # 已被更新的请求取代
+                    continue
+                self._preview_loading = None
+                image_path, canvas_size = key
+                if isinstance(result, Exception):
+                    print(f"加载预览图片时出错 {image_path}: {result}")
+                    self.preview_canvas.delete("all")
+                    self.preview_canvas.create_text(canvas_size[0] // 2, canvas_size[1] // 2,
+                                                    text=f"预览失败: {str(result)}",
+                                                    font=self.font_config['normal'], fill="red")
+                    continue
+                resized_img, ratio, orig_size, image_date, stat_result = result
+                proxy = PreviewProxy(resized_img, ImageTk.PhotoImage(resized_img), ratio, orig_size, image_date)
+                self.preview_cache.put(image_path, canvas_size, proxy, stat_result)
+                self.update_preview()
+        except queue.Empty:
+            pass
+        if self._preview_loading is not None:
+            self.root.after(PREVIEW_FRAME_MS, self.poll_preview_results)
+        else:
+            self._preview_polling = False
+    
+    def load_preview_image(self, image_path, canvas_size):
+        # 打开图片并按画布尺寸缩放（保持原图比例），同时解析水印日期（可在后台线程中调用，不访问Tk）
+        # 文件只读取一次，解码、EXIF日期和缓存有效性检查都使用同一份内容和stat结果
+        from PIL import Image
+        from watermark_render import load_resized_image
+        from watermark_export import get_image_date
+        from watermark_index import read_source_file
+        canvas_width, canvas_height = canvas_size
+        source = read_source_file(image_path)
+        img = Image.open(io.BytesIO(source.data))
+        width, height = img.size
+        ratio = min(canvas_width / width, canvas_height / height)
+        new_size = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+        # 大幅缩小JPEG时先用DCT缩放解码为较小尺寸
+        resized_img = load_resized_image(img, new_size)
+        resized_img.load()
+        # 拍摄日期（无EXIF时为文件修改时间），文件未变化时直接从元数据索引读取
+        image_date = get_image_date(image_path, source)
+        return resized_img, ratio, (width, height), image_date, source.stat
+    
+    def draw_draggable_watermark(self, img_x, img_y, ratio, orig_width, orig_height, image_date=None):
         """绘制可拖动的水印文本"""
         try:
-            # 获取水印文本
-            text_type = self.text_type_var.get()
-            if text_type == "custom":
-                watermark_text = self.custom_text_var.get().strip()
-                if not watermark_text:
-                    watermark_text = self.get_exif_datetime(self.image_paths[self.current_preview_index])
-                    if not watermark_text:
-                        mtime = os.path.getmtime(self.image_paths[self.current_preview_index])
-                        dt = datetime.fromtimestamp(mtime)
-                        watermark_text = dt.strftime('%Y-%m-%d')
-            else:
-                watermark_text = self.get_exif_datetime(self.image_paths[self.current_preview_index])
-                if not watermark_text:
-                    mtime = os.path.getmtime(self.image_paths[self.current_preview_index])
-                    dt = datetime.fromtimestamp(mtime)
-                    watermark_text = dt.strftime('%Y-%m-%d')
+            # 获取水印文本，日期由预览缓存提供
+            if image_date is None:
+                image_date = self.get_image_date(self.image_paths.get(self.current_preview_id))
+            watermark_text = image_date
+            if self.text_type_var.get() == "custom":
+                # 自定义文本为空时使用日期
+                watermark_text = self.custom_text_var.get().strip() or image_date
             
             # 计算水印位置
             margin = 10 * ratio
             font_size = int(self.font_size_var.get() * ratio)
             
-            # 尝试创建字体
+            # 获取缓存的字体对象；字体索引在后台读取完成之前使用默认字体，避免界面等待字体扫描
             font = None
             try:
-                selected_font = self.font_var.get()
-                common_font_paths = {
-                    'Microsoft YaHei': 'msyh.ttc',
-                    'SimHei': 'simhei.ttf',
-                    'SimSun': 'simsun.ttc',
-                    'Arial': 'arial.ttf',
-                    'Times New Roman': 'times.ttf',
-                    'Courier New': 'cour.ttf',
-                    'KaiTi': 'simkai.ttf',
-                    'FangSong': 'simsun.ttc'
-                }
-                
-                if sys.platform.startswith('win'):
-                    font_dir = 'C:\\Windows\\Fonts'
-                    if selected_font in common_font_paths:
-                        font_file = common_font_paths[selected_font]
-                        font_path = os.path.join(font_dir, font_file)
-                        if os.path.exists(font_path):
-                            try:
-                                font = ImageFont.truetype(font_path, font_size)
-                            except:
-                                pass
-                    else:
-                        if 'Arial' in common_font_paths:
-                            font_file = common_font_paths['Arial']
-                            font_path = os.path.join(font_dir, font_file)
-                            if os.path.exists(font_path):
-                                try:
-                                    font = ImageFont.truetype(font_path, font_size)
-                                except:
-                                    pass
-                
-                if font is None:
-                    from PIL import ImageFont
-                    font = ImageFont.load_default()
-            except:
+                from watermark_fonts import get_font, get_default_font, is_font_index_ready
+                if is_font_index_ready():
+                    font = get_font(self.font_var.get(), max(1, font_size), self.bold_var.get(), self.italic_var.get())
+                else:
+                    font = get_default_font()
+            except Exception:
                 font = None
             
             # 获取文本尺寸
@@ -1834,462 +2093,34 @@ class WatermarkApp:
             
             self.is_dragging_watermark = False
             self.preview_canvas.config(cursor="arrow")
+            # 拖动期间被跳过的重绘请求（如滑块或设置变化）在这里补上
+            self.update_preview()
     
     def generate_preview_image(self, image_path):
-        # 生成带水印的预览图像
+        # 生成带水印的预览图像（与导出使用相同的渲染代码）
+        from PIL import Image
+        from watermark_render import normalize_image_mode
+        from watermark_export import get_watermark_text, apply_watermark
+        from watermark_index import read_source_file
         try:
-            # 打开图片
-            img = Image.open(image_path)
-            width, height = img.size
-            
-            # 确保图像支持透明度
-            if img.mode != 'RGBA':
-                img = img.convert('RGBA')
-            
-            # 创建绘制对象
-            draw = ImageDraw.Draw(img)
-            
-            # 根据水印类型获取水印文本
-            text_type = self.text_type_var.get()
-            if text_type == "custom":
-                # 使用自定义文本
-                watermark_text = self.custom_text_var.get().strip()
-                # 如果自定义文本为空，使用日期作为默认值
-                if not watermark_text:
-                    watermark_text = self.get_exif_datetime(image_path)
-                    if not watermark_text:
-                        # 如果没有EXIF日期信息，使用文件修改时间
-                        mtime = os.path.getmtime(image_path)
-                        dt = datetime.fromtimestamp(mtime)
-                        watermark_text = dt.strftime('%Y-%m-%d')
-            else:
-                # 使用日期水印
-                watermark_text = self.get_exif_datetime(image_path)
-                if not watermark_text:
-                    # 如果没有EXIF日期信息，使用文件修改时间
-                    mtime = os.path.getmtime(image_path)
-                    dt = datetime.fromtimestamp(mtime)
-                    watermark_text = dt.strftime('%Y-%m-%d')
-            
-            # 设置水印字体和大小
-            font = None
-            try:
-                # 获取用户选择的字体、大小
-                selected_font = self.font_var.get()
-                
-                # 预定义常见字体及其文件路径映射
-                common_font_paths = {
-                    'Microsoft YaHei': 'msyh.ttc',
-                    'SimHei': 'simhei.ttf',
-                    'SimSun': 'simsun.ttc',
-                    'Arial': 'arial.ttf',
-                    'Times New Roman': 'times.ttf',
-                    'Courier New': 'cour.ttf',
-                    'KaiTi': 'simkai.ttf',
-                    'FangSong': 'simsun.ttc'
-                }
-                
-                # 首先尝试使用Windows系统字体目录的绝对路径
-                if sys.platform.startswith('win'):
-                    font_dir = 'C:\\Windows\\Fonts'
-                    
-                    # 检查字体是否在预定义列表中
-                    if selected_font in common_font_paths:
-                        font_file = common_font_paths[selected_font]
-                        font_path = os.path.join(font_dir, font_file)
-                        
-                        if os.path.exists(font_path):
-                            try:
-                                font = ImageFont.truetype(font_path, self.font_size_var.get())
-                            except (IOError, OSError):
-                                pass
-                    else:
-                        # 尝试使用Arial作为默认替代字体
-                        if 'Arial' in common_font_paths:
-                            font_file = common_font_paths['Arial']
-                            font_path = os.path.join(font_dir, font_file)
-                            if os.path.exists(font_path):
-                                try:
-                                    font = ImageFont.truetype(font_path, self.font_size_var.get())
-                                except (IOError, OSError):
-                                    pass
-                
-                # 如果前面都失败，使用PIL默认字体
-                if font is None:
-                    font = ImageFont.load_default()
-            except Exception:
-                # 出现任何异常，都使用默认字体
-                font = ImageFont.load_default()
-            
-            # 获取文本大小
-            bbox = font.getbbox(watermark_text)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            # 计算水印位置
-            margin = 10
-            position = self.position_var.get()
-            
-            # 检查是否为自定义位置
-            if position == "custom" and self.custom_watermark_position:
-                # 使用自定义位置（相对坐标）
-                rel_x, rel_y = self.custom_watermark_position
-                # 将相对位置转换为绝对位置（水印左上角坐标）
-                x = width * rel_x - text_width // 2
-                y = height * rel_y - text_height // 2
-            else:
-                # 根据选择的预设位置计算
-                if position == 'top-left':
-                    x, y = margin, margin
-                elif position == 'top-right':
-                    x, y = width - text_width - margin, margin
-                elif position == 'bottom-left':
-                    x, y = margin, height - text_height - margin
-                elif position == 'bottom-right':
-                    x, y = width - text_width - margin, height - text_height - margin
-                elif position == 'center':
-                    x, y = (width - text_width) // 2, (height - text_height) // 2
-                elif position == 'top':
-                    x, y = (width - text_width) // 2, margin
-                elif position == 'bottom':
-                    x, y = (width - text_width) // 2, height - text_height - margin
-                elif position == 'left':
-                    x, y = margin, (height - text_height) // 2
-                elif position == 'right':
-                    x, y = width - text_width - margin, (height - text_height) // 2
-                else:
-                    # 默认右下角
-                    x, y = width - text_width - margin, height - text_height - margin
-            
-            # 获取透明度设置
-            text_opacity = self.opacity_var.get()
-            
-            # 解析颜色并应用透明度
-            text_color_rgba = self.parse_color(self.text_color_var.get(), text_opacity)
-            
-            # 创建一个透明图层用于绘制水印
-            watermark_layer = Image.new('RGBA', img.size, (255, 255, 255, 0))
-            watermark_draw = ImageDraw.Draw(watermark_layer)
-            
-            # 在透明图层上绘制水印文本
-            # 先绘制描边（如果启用）
-            if self.stroke_var.get():
-                stroke_width = self.stroke_width_var.get()
-                stroke_color_rgba = self.parse_color(self.stroke_color_var.get(), text_opacity)
-                # 使用循环在不同方向上绘制描边
-                for offset_x in range(-stroke_width, stroke_width + 1):
-                    for offset_y in range(-stroke_width, stroke_width + 1):
-                        if offset_x != 0 or offset_y != 0:
-                            watermark_draw.text((x + offset_x, y + offset_y), 
-                                              watermark_text, font=font, fill=stroke_color_rgba)
-            
-            # 再绘制阴影（如果启用）
-            if self.shadow_var.get():
-                shadow_offset = self.shadow_offset_var.get()
-                shadow_color_rgba = self.parse_color(self.shadow_color_var.get(), text_opacity)
-                watermark_draw.text((x + shadow_offset, y + shadow_offset), 
-                                  watermark_text, font=font, fill=shadow_color_rgba)
-            
-            # 最后绘制主要文本
-            watermark_draw.text((x, y), watermark_text, font=font, fill=text_color_rgba)
-            
-            # 将水印图层合并到原图上
-            img = Image.alpha_composite(img, watermark_layer)
-            
-            return img
+            settings = self.capture_render_settings()
+            source = read_source_file(image_path)
+            img = normalize_image_mode(Image.open(io.BytesIO(source.data)))
+            return apply_watermark(img, get_watermark_text(image_path, settings, source), settings)
         except Exception as e:
             print(f"生成预览图像时出错: {e}")
             raise
-    
-    def add_watermark_to_image(self, image_path, output_dir, font_size=30, text_color='black', bg_color='white', position='bottom-right', output_format='JPEG', quality=95, resize_method='none', target_width=1920, target_height=1080, scale_percent=100):
-        # 为图片添加水印并保存
-        try:
-            print(f"\n=== 开始处理图片: {os.path.basename(image_path)} ===")
-            # 打开图片
-            img = Image.open(image_path)
-            width, height = img.size
-            
-            # 根据调整方式调整图片尺寸
-            if resize_method == 'width':
-                # 按宽度缩放
-                ratio = target_width / width
-                new_height = int(height * ratio)
-                img = img.resize((target_width, new_height), Image.LANCZOS)
-                width, height = img.size
-            elif resize_method == 'height':
-                # 按高度缩放
-                ratio = target_height / height
-                new_width = int(width * ratio)
-                img = img.resize((new_width, target_height), Image.LANCZOS)
-                width, height = img.size
-            elif resize_method == 'percent':
-                # 按百分比缩放
-                new_width = int(width * scale_percent / 100)
-                new_height = int(height * scale_percent / 100)
-                img = img.resize((new_width, new_height), Image.LANCZOS)
-                width, height = img.size
-                
-            # 确保图像支持透明度
-            if img.mode != 'RGBA':
-                img = img.convert('RGBA')
-            
-            # 创建绘制对象
-            draw = ImageDraw.Draw(img)
-            
-            # 根据水印类型获取水印文本
-            text_type = self.text_type_var.get()
-            if text_type == "custom":
-                # 使用自定义文本
-                watermark_text = self.custom_text_var.get().strip()
-                # 如果自定义文本为空，使用日期作为默认值
-                if not watermark_text:
-                    watermark_text = self.get_exif_datetime(image_path)
-                    if not watermark_text:
-                        # 如果没有EXIF日期信息，使用文件修改时间
-                        mtime = os.path.getmtime(image_path)
-                        dt = datetime.fromtimestamp(mtime)
-                        watermark_text = dt.strftime('%Y-%m-%d')
-            else:
-                # 使用日期水印
-                watermark_text = self.get_exif_datetime(image_path)
-                if not watermark_text:
-                    # 如果没有EXIF日期信息，使用文件修改时间
-                    mtime = os.path.getmtime(image_path)
-                    dt = datetime.fromtimestamp(mtime)
-                    watermark_text = dt.strftime('%Y-%m-%d')
-            
-            # 设置水印字体和大小
-            font = None
-            try:
-                # 获取用户选择的字体、大小
-                selected_font = self.font_var.get()
-                print(f"=== 尝试加载字体: {selected_font}, 大小: {font_size} ===")
-                
-                # 预定义常见字体及其文件路径映射（根据测试结果，这是最可靠的方法）
-                common_font_paths = {
-                    'Microsoft YaHei': 'msyh.ttc',
-                    'SimHei': 'simhei.ttf',
-                    'SimSun': 'simsun.ttc',
-                    'Arial': 'arial.ttf',
-                    'Times New Roman': 'times.ttf',
-                    'Courier New': 'cour.ttf',
-                    'KaiTi': 'simkai.ttf',
-                    'FangSong': 'simsun.ttc'
-                }
-                
-                # 首先尝试使用Windows系统字体目录的绝对路径
-                if sys.platform.startswith('win'):
-                    font_dir = 'C:\\Windows\\Fonts'
-                    
-                    # 检查字体是否在预定义列表中
-                    if selected_font in common_font_paths:
-                        font_file = common_font_paths[selected_font]
-                        font_path = os.path.join(font_dir, font_file)
-                        
-                        if os.path.exists(font_path):
-                            try:
-                                font = ImageFont.truetype(font_path, font_size)
-                                print(f"✓ 成功从预定义路径加载字体: {font_path}")
-                            except (IOError, OSError) as e:
-                                print(f"✗ 无法从预定义路径加载字体: {font_path}, 错误: {str(e)}")
-                    else:
-                        # 如果不在预定义列表中，尝试映射到最接近的字体
-                        print(f"✗ 字体 '{selected_font}' 不在预定义列表中，尝试使用替代字体")
-                        # 尝试使用Arial作为默认替代字体
-                        if 'Arial' in common_font_paths:
-                            font_file = common_font_paths['Arial']
-                            font_path = os.path.join(font_dir, font_file)
-                            if os.path.exists(font_path):
-                                try:
-                                    font = ImageFont.truetype(font_path, font_size)
-                                    print(f"✓ 成功加载替代字体: {font_path}")
-                                except (IOError, OSError) as e:
-                                    print(f"✗ 无法加载替代字体: {font_path}, 错误: {str(e)}")
-                
-                # 如果预定义路径加载失败，尝试搜索系统字体目录的所有字体文件
-                if font is None and sys.platform.startswith('win'):
-                    font_dir = 'C:\\Windows\\Fonts'
-                    if os.path.exists(font_dir):
-                        print(f"✗ 预定义路径加载失败，尝试搜索系统字体目录")
-                        # 搜索常见的字体文件格式
-                        font_extensions = ['.ttf', '.ttc', '.otf']
-                        # 优先搜索的常见字体文件
-                        priority_files = ['arial.ttf', 'simhei.ttf', 'msyh.ttc', 'simsun.ttc', 'times.ttf', 'cour.ttf']
-                        
-                        # 先尝试优先级列表中的字体
-                        for font_file in priority_files:
-                            font_path = os.path.join(font_dir, font_file)
-                            if os.path.exists(font_path):
-                                try:
-                                    font = ImageFont.truetype(font_path, font_size)
-                                    print(f"✓ 成功从系统目录加载优先字体: {font_path}")
-                                    break
-                                except (IOError, OSError):
-                                    continue
-                        
-                        # 如果优先级列表中的字体都失败，尝试搜索所有字体文件
-                        if font is None:
-                            for file in os.listdir(font_dir):
-                                if any(file.lower().endswith(ext) for ext in font_extensions):
-                                    font_path = os.path.join(font_dir, file)
-                                    try:
-                                        font = ImageFont.truetype(font_path, font_size)
-                                        print(f"✓ 成功从系统目录加载字体: {font_path}")
-                                        break
-                                    except (IOError, OSError):
-                                        continue
-                
-                # 如果前面都失败，使用PIL默认字体作为最后的后备选项
-                if font is None:
-                    print(f"✗ 无法加载任何字体，使用PIL默认字体")
-                    font = ImageFont.load_default()
-            except Exception as e:
-                print(f"✗ 字体加载异常: {str(e)}")
-                # 出现任何异常，都使用默认字体
-                font = ImageFont.load_default()
-            
-            print(f"最终使用字体: {'默认字体' if font is ImageFont.load_default() else '成功加载的字体'}")
-            
-            # 获取文本大小
-            bbox = font.getbbox(watermark_text)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            print(f"水印文本: '{watermark_text}', 文本尺寸: {text_width}x{text_height}")
-            
-            # 计算水印位置
-            margin = 10
-            
-            # 添加调试信息
-            print(f"当前position参数: {position}")
-            print(f"当前custom_watermark_position: {self.custom_watermark_position if hasattr(self, 'custom_watermark_position') else '未定义'}")
-            print(f"当前position_var值: {self.position_var.get()}")
-            
-            # 检查是否有自定义位置
-            if hasattr(self, 'custom_watermark_position') and self.custom_watermark_position and position == 'custom':
-                # 使用用户通过拖拽设置的自定义位置
-                rel_x, rel_y = self.custom_watermark_position
-                # 将相对位置转换为绝对位置（水印中心坐标）
-                center_x = int(width * rel_x)
-                center_y = int(height * rel_y)
-                # 计算水印左上角位置
-                x = center_x - text_width // 2
-                y = center_y - text_height // 2
-                print(f"使用自定义位置: ({rel_x}, {rel_y}) -> 绝对位置: ({x}, {y})")
-            else:
-                # 使用预设位置
-                if position == 'top-left':
-                    x, y = margin, margin
-                elif position == 'top-right':
-                    x, y = width - text_width - margin, margin
-                elif position == 'bottom-left':
-                    x, y = margin, height - text_height - margin
-                elif position == 'bottom-right':
-                    x, y = width - text_width - margin, height - text_height - margin
-                elif position == 'center':
-                    x, y = (width - text_width) // 2, (height - text_height) // 2
-                elif position == 'top':
-                    x, y = (width - text_width) // 2, margin
-                elif position == 'bottom':
-                    x, y = (width - text_width) // 2, height - text_height - margin
-                elif position == 'left':
-                    x, y = margin, (height - text_height) // 2
-                elif position == 'right':
-                    x, y = width - text_width - margin, (height - text_height) // 2
-                else:
-                    # 默认右下角
-                    x, y = width - text_width - margin, height - text_height - margin
-            
-            # 获取透明度设置
-            text_opacity = self.opacity_var.get()
-            print(f"水印设置: 文本='{watermark_text}', 字体='{selected_font}', 大小={font_size}, 颜色={text_color}, 不透明度={text_opacity}%")
-            
-            # 解析颜色并应用透明度
-            text_color_rgba = self.parse_color(text_color, text_opacity)
-            print(f"应用的颜色RGBA值: {text_color_rgba}")
-            # 不再使用背景颜色 - 移除背景绘制
-            
-            # 创建一个透明图层用于绘制水印
-            watermark_layer = Image.new('RGBA', img.size, (255, 255, 255, 0))
-            watermark_draw = ImageDraw.Draw(watermark_layer)
-            
-            print(f"绘制水印: 位置({x}, {y}), 颜色{text_color_rgba}")
-            
-            # 在透明图层上绘制水印文本
-            # 先绘制描边（如果启用）
-            if self.stroke_var.get():
-                stroke_width = self.stroke_width_var.get()
-                stroke_color_rgba = self.parse_color(self.stroke_color_var.get(), text_opacity)
-                # 使用循环在不同方向上绘制描边
-                for offset_x in range(-stroke_width, stroke_width + 1):
-                    for offset_y in range(-stroke_width, stroke_width + 1):
-                        if offset_x != 0 or offset_y != 0:
-                            watermark_draw.text((x + offset_x, y + offset_y), 
-                                              watermark_text, font=font, fill=stroke_color_rgba)
-            
-            # 再绘制阴影（如果启用）
-            if self.shadow_var.get():
-                shadow_offset = self.shadow_offset_var.get()
-                shadow_color_rgba = self.parse_color(self.shadow_color_var.get(), text_opacity)
-                watermark_draw.text((x + shadow_offset, y + shadow_offset), 
-                                  watermark_text, font=font, fill=shadow_color_rgba)
-            
-            # 最后绘制主要文本
-            watermark_draw.text((x, y), watermark_text, font=font, fill=text_color_rgba)
-            
-
-            
-            # 将水印图层合并到原图上
-            img = Image.alpha_composite(img, watermark_layer)
-            
-            # 不再需要背景颜色设置 - 代码中已移除背景绘制
-            
-            # 确保输出目录存在
-            os.makedirs(output_dir, exist_ok=True)
-            
-            # 生成输出文件名
-            filename = os.path.basename(image_path)
-            name_without_ext, ext = os.path.splitext(filename)
-            
-            # 应用命名规则
-            naming_rule = self.naming_var.get()
-            if naming_rule == 'original':
-                output_filename = filename
-            elif naming_rule == 'prefix':
-                output_filename = f"{self.prefix_var.get()}{filename}"
-            else:  # suffix
-                output_filename = f"{name_without_ext}{self.suffix_var.get()}{ext}"
-            
-            # 根据输出格式调整扩展名
-            if output_format == 'PNG':
-                output_filename = os.path.splitext(output_filename)[0] + '.png'
-            elif output_format == 'JPG':
-                output_filename = os.path.splitext(output_filename)[0] + '.jpg'
-            else:  # JPEG
-                output_filename = os.path.splitext(output_filename)[0] + '.jpeg'
-            
-            # 保存图片
-            output_path = os.path.join(output_dir, output_filename)
-            
-            # 根据输出格式设置保存参数
-            if output_format == 'PNG':
-                # 对于PNG格式，直接保存以保留透明度
-                img.save(output_path, format='PNG')
-                print(f"已保存带透明背景的PNG图片: {output_path}")
-            else:  # JPEG or JPG
-                # 统一使用JPEG格式保存，因为JPG是JPEG的一种常见扩展名
-                # 由于JPEG不支持透明背景，创建白色背景并使用alpha通道作为蒙版
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[3])  # 3 is the alpha channel
-                background.save(output_path, format='JPEG', quality=quality)
-                print(f"已保存JPEG图片 (透明背景转换为白色): {output_path}")
-            
-            return True
-        except Exception as e:
-            print(f"处理图片时出错 {image_path}: {e}")
-            return False
 
 if __name__ == "__main__":
+    # 打包为可执行文件后，进程池的子进程需要此调用才能正常启动（未打包时不需要，也不必在启动时导入multiprocessing）
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    
+    # --startup-profile：输出启动各阶段的耗时
+    profile = StartupProfile('--startup-profile' in sys.argv, _IMPORT_START)
+    profile.mark("导入模块")
+    
     try:
         from tkinterdnd2 import TkinterDnD
         # 创建支持拖放的主窗口
@@ -2298,9 +2129,10 @@ if __name__ == "__main__":
         # 如果tkinterdnd2不可用，回退到标准Tk窗口
         print("tkinterdnd2库不可用，使用标准窗口")
         root = tk.Tk()
+    profile.mark("创建主窗口")
     
     # 创建应用实例
-    app = WatermarkApp(root)
+    app = WatermarkApp(root, profile)
     
     # 绑定画布大小变化事件，更新预览
     def on_canvas_resize(event):
@@ -0,0 +1,175 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+# 每行占用的高度（像素）：100像素的缩略图加上边框和上下边距
+ROW_HEIGHT = 120
+
+# 行与行之间的间距（像素）
+ROW_SPACING = 5
+
+# 可见区域上下额外准备的行数，滚动时不会露出空白
+OVERSCAN_ROWS = 2
+
+# 选中行的背景色
+SELECTED_BG = "#e0e0e0"
+
+
+class _ListRow:
+    """
+    列表中的一行控件，滚动时重新绑定到其他图片
+    """
+
+    def __init__(self, frame, image_label, path_label, delete_button, window):
+        self.frame = frame
+        self.image_label = image_label
+        self.path_label = path_label
+        self.delete_button = delete_button
+        self.window = window
+        # 当前显示的图片id，未使用时为None
+        self.image_id = None
+
+
+class VirtualImageList:
+    """
+    虚拟化的图片列表：只为可见的行创建控件，滚动时复用这些控件显示其他图片，
+    导入上万张图片时控件数量也只和列表高度有关。
+
+    collection 为 ImageCollection；on_select(image_id) 和 on_remove(image_id) 为点击和删除回调；
+    get_thumbnail(image_id, image_path) 返回要显示的PhotoImage，缩略图无法生成时返回None。
+    缩略图在后台生成完成后由调用方调用 refresh_item 更新。
+    """
+
+    def __init__(self, parent, collection, on_select, on_remove, get_thumbnail, font):
+        self.collection = collection
+        self.on_select = on_select
+        self.on_remove = on_remove
+        self.get_thumbnail = get_thumbnail
+        self.font = font
+        self.selected_id = None
+        self._rows = []
+        self._scrollregion = None
+        self._width = 0
+
+        self.canvas = tk.Canvas(parent, highlightthickness=0, yscrollincrement=ROW_HEIGHT)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_scroll)
+        self.normal_bg = self.canvas.cget("bg")
+
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        self.canvas.bind("<MouseWheel>", self._on_mousewheel)
+
+    def _on_mousewheel(self, event):
+        # 每次滚动一行
+        self.canvas.yview_scroll(-1 if event.delta > 0 else 1, "units")
+        return "break"
+
+    def _on_scroll(self, first, last):
+        # 视图滚动后更新滚动条并重新分配可见行
+        self.scrollbar.set(first, last)
+        self._update_rows()
+
+    def _create_row(self):
+        frame = tk.Frame(self.canvas, bd=1, relief=tk.RAISED, cursor="hand2")
+        image_label = tk.Label(frame, cursor="hand2")
+        image_label.pack(side=tk.LEFT, padx=5, pady=5)
+        path_label = tk.Label(frame, font=self.font, justify=tk.LEFT, anchor=tk.W, cursor="hand2")
+        path_label.pack(side=tk.LEFT, padx=5, pady=5, fill=tk.X, expand=True)
+        delete_button = tk.Button(frame, text="删除", font=self.font, width=8)
+        delete_button.pack(side=tk.RIGHT, padx=5, pady=5)
+        window = self.canvas.create_window((0, 0), window=frame, anchor="nw", state="hidden")
+
+        row = _ListRow(frame, image_label, path_label, delete_button, window)
+        # 事件处理通过行对象找到当前显示的图片，行被复用后仍然指向正确的图片
+        for widget in (frame, image_label, path_label):
+            widget.bind("<Button-1>", lambda event, row=row: self._select_row(row))
+            widget.bind("<MouseWheel>", self._on_mousewheel)
+        delete_button.config(command=lambda row=row: self._remove_row(row))
+        return row
+
+    def _select_row(self, row):
+        if row.image_id is not None:
+            self.on_select(row.image_id)
+
+    def _remove_row(self, row):
+        if row.image_id is not None:
+            self.on_remove(row.image_id)
+
+    def refresh(self):
+        """
+        图片增删或列表尺寸变化后调用，更新滚动范围和可见行
+        """
+        width = self.canvas.winfo_width()
+        scrollregion = (0, 0, width, len(self.collection) * ROW_HEIGHT)
+        if scrollregion != self._scrollregion:
+            # 滚动范围只在变化时设置，避免触发多余的滚动回调
+            self._scrollregion = scrollregion
+            self.canvas.configure(scrollregion=scrollregion)
+        self._update_rows()
+
+    def _update_rows(self):
+        total = len(self.collection)
+        width = self.canvas.winfo_width()
+        first = max(0, int(self.canvas.canvasy(0)) // ROW_HEIGHT - OVERSCAN_ROWS)
+        last = min(total, first + self.canvas.winfo_height() // ROW_HEIGHT + 1 + 2 * OVERSCAN_ROWS)
+
+        while len(self._rows) < last - first:
+            self._rows.append(self._create_row())
+
+        width_changed = width != self._width
+        self._width = width
+        for offset, row in enumerate(self._rows):
+            index = first + offset
+            if index >= last:
+                if row.image_id is not None:
+                    row.image_id = None
+                    self.canvas.itemconfigure(row.window, state="hidden")
+                continue
+
+            image_id = self.collection.id_at(index)
+            self.canvas.coords(row.window, 0, index * ROW_HEIGHT)
+            if row.image_id is None or width_changed:
+                self.canvas.itemconfigure(row.window, width=width, height=ROW_HEIGHT - ROW_SPACING, state="normal")
+                # 路径文字宽度跟随列表宽度（缩略图和删除按钮约占220像素）
+                row.path_label.config(wraplength=max(100, width - 220))
+            if row.image_id != image_id:
+                row.image_id = image_id
+                row.path_label.config(text=self.collection.get(image_id))
+                self._show_thumbnail(row)
+            self._show_selection(row)
+
+    def _show_thumbnail(self, row):
+        thumbnail = self.get_thumbnail(row.image_id, self.collection.get(row.image_id))
+        if thumbnail is None:
+            row.image_label.config(image='', text="无预览", width=12, height=5)
+        else:
+            # 从文字恢复为图片时 width/height 的单位会变为像素，重置为0表示按图片尺寸
+            row.image_label.config(image=thumbnail, text='', width=0, height=0)
+
+    def _show_selection(self, row):
+        bg = SELECTED_BG if row.image_id == self.selected_id else self.normal_bg
+        row.frame.config(bg=bg)
+
+    def refresh_item(self, image_id):
+        """
+        图片的缩略图生成后调用，只更新正在显示这张图片的行
+        """
+        for row in self._rows:
+            if row.image_id == image_id:
+                self._show_thumbnail(row)
+
+    def set_selected(self, image_id):
+        # 高亮显示选中的图片项
+        self.selected_id = image_id
+        for row in self._rows:
+            if row.image_id is not None:
+                self._show_selection(row)
+
+    def visible_ids(self):
+        """
+        返回当前正在显示的图片id
+        """
+        return [row.image_id for row in self._rows if row.image_id is not None]
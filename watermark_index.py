@@ -0,0 +1,173 @@
+import io
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from datetime import datetime
+from PIL import Image
+from watermark_cache import USER_CACHE_DIR
+from watermark_exif import read_exif_date
+
+
+# 默认的元数据索引文件位置
+DEFAULT_INDEX_PATH = os.path.join(USER_CACHE_DIR, 'metadata.db')
+
+# 日期来源：EXIF标签名，或没有EXIF日期时使用文件修改时间
+DATE_SOURCE_MTIME = 'mtime'
+
+# 图片元数据：水印日期（YYYY-MM-DD）、日期来源、像素尺寸和图片格式
+ImageMetadata = namedtuple('ImageMetadata', ['date', 'date_source', 'width', 'height', 'format'])
+
+# 一次读入内存的输入文件：路径、文件内容和打开文件时的stat结果
+SourceFile = namedtuple('SourceFile', ['path', 'data', 'stat'])
+
+
+def read_source_file(image_path, stat_result=None):
+    """
+    打开一次文件并顺序读取全部内容。EXIF解析、解码和修改时间都使用返回的内容和stat结果，
+    网络共享上每张图片只需要一次打开和读取。stat_result 为已经获取的stat结果（如增量处理时），为None时对打开的文件调用fstat
+    """
+    with open(image_path, 'rb') as f:
+        if stat_result is None:
+            stat_result = os.fstat(f.fileno())
+        data = f.read()
+    return SourceFile(image_path, data, stat_result)
+
+
+def _read_header_metadata(image_path, f):
+    # 只读取文件头部：EXIF日期、像素尺寸和图片格式
+    try:
+        exif_date = read_exif_date(f)
+    except Exception as e:
+        print(f"读取EXIF信息时出错 {image_path}: {e}")
+        exif_date = None
+    f.seek(0)
+    try:
+        # Image.open 只解析文件头，不会解码像素数据
+        with Image.open(f) as img:
+            return exif_date, img.size, img.format
+    except (IOError, OSError, SyntaxError):
+        return exif_date, (None, None), None
+
+
+def read_image_metadata(image_path, stat_result=None, data=None):
+    """
+    直接从文件读取图片元数据（不经过索引），data 为已读入内存的文件内容时不再打开文件
+    """
+    if stat_result is None:
+        stat_result = os.stat(image_path)
+
+    if data is not None:
+        exif_date, (width, height), image_format = _read_header_metadata(image_path, io.BytesIO(data))
+    else:
+        with open(image_path, 'rb') as f:
+            exif_date, (width, height), image_format = _read_header_metadata(image_path, f)
+
+    if exif_date:
+        date_source, date = exif_date
+    else:
+        # 如果没有EXIF日期信息，使用文件修改时间
+        date_source = DATE_SOURCE_MTIME
+        date = datetime.fromtimestamp(stat_result.st_mtime).strftime('%Y-%m-%d')
+    return ImageMetadata(date, date_source, width, height, image_format)
+
+
+class MetadataIndex:
+    """
+    持久化的图片元数据索引（SQLite），以 (路径, 文件大小, 修改时间ns) 判断记录是否有效。
+    文件未变化时只需要一次 stat 即可得到水印日期和图片尺寸。
+    """
+
+    def __init__(self, db_path=DEFAULT_INDEX_PATH):
+        self.db_path = db_path
+        self.enabled = True
+        # 每个线程（以及fork出的子进程）使用独立的数据库连接
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS image_metadata ('
+            'path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, '
+            'date TEXT NOT NULL, date_source TEXT NOT NULL, '
+            'width INTEGER, height INTEGER, format TEXT)'
+        )
+        conn.commit()
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _disable(self, error):
+        # 索引不可用（如目录只读、数据库损坏）时退回到直接读取文件
+        if self.enabled:
+            print(f"元数据索引不可用，将直接读取图片信息: {error}")
+        self.enabled = False
+
+    def get(self, image_path, stat_result=None, data=None):
+        """
+        获取图片元数据，索引中没有有效记录时读取文件（data 不为None时使用已读入的内容）并写入索引
+        """
+        image_path = os.path.abspath(image_path)
+        if stat_result is None:
+            stat_result = os.stat(image_path)
+        if not self.enabled:
+            return read_image_metadata(image_path, stat_result, data)
+
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT date, date_source, width, height, format FROM image_metadata '
+                'WHERE path = ? AND size = ? AND mtime_ns = ?',
+                (image_path, stat_result.st_size, stat_result.st_mtime_ns)
+            ).fetchone()
+        except (sqlite3.Error, OSError) as e:
+            self._disable(e)
+            return read_image_metadata(image_path, stat_result, data)
+        if row:
+            return ImageMetadata(*row)
+
+        metadata = read_image_metadata(image_path, stat_result, data)
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO image_metadata '
+                '(path, size, mtime_ns, date, date_source, width, height, format) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (image_path, stat_result.st_size, stat_result.st_mtime_ns) + tuple(metadata)
+            )
+            conn.commit()
+        except (sqlite3.Error, OSError) as e:
+            self._disable(e)
+        return metadata
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_metadata_index():
+    """
+    获取进程内共享的默认元数据索引
+    """
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = MetadataIndex()
+        return _default_index
+
+
+def get_image_metadata(image_path, use_index=True, source=None):
+    """
+    获取图片元数据，use_index 为False时不读写索引。
+    source 为 read_source_file 的结果时使用其中的文件内容和stat结果，不再访问文件
+    """
+    stat_result, data = (source.stat, source.data) if source is not None else (None, None)
+    if not use_index:
+        return read_image_metadata(image_path, stat_result, data)
+    return get_metadata_index().get(image_path, stat_result, data)
@@ -0,0 +1,154 @@
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from PIL import Image, JpegImagePlugin
+from watermark_render import composite_stamp
+
+
+# jpegtran（libjpeg-turbo 2.1+ 或 IJG libjpeg 9+ 提供）的程序名，用于在DCT系数层面裁剪和插入图块
+JPEGTRAN_NAME = 'jpegtran'
+
+# 单次调用jpegtran的超时时间（秒）
+JPEGTRAN_TIMEOUT = 60
+
+# Windows下调用命令行程序时不弹出控制台窗口
+_CREATE_NO_WINDOW = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+_jpegtran_path = None
+_jpegtran_checked = False
+_jpegtran_lock = threading.Lock()
+
+
+class JpegRegionError(Exception):
+    """无法只重新编码水印区域时抛出，调用方应回退到整幅图片重新编码"""
+
+
+def _supports_drop(jpegtran):
+    """
+    检查jpegtran是否支持 -drop（libjpeg-turbo 2.1之前的版本不支持）。
+    jpegtran遇到不认识的参数时输出用法说明，从中查找 -drop
+    """
+    try:
+        result = subprocess.run([jpegtran, '-help'], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, timeout=JPEGTRAN_TIMEOUT, creationflags=_CREATE_NO_WINDOW)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return b'-drop' in result.stdout
+
+
+def find_jpegtran():
+    """
+    返回支持 -drop 的jpegtran的路径，没有安装或版本过旧时返回None（只查找一次）
+    """
+    global _jpegtran_path, _jpegtran_checked
+    with _jpegtran_lock:
+        if not _jpegtran_checked:
+            _jpegtran_checked = True
+            jpegtran = shutil.which(JPEGTRAN_NAME)
+            if jpegtran is None:
+                print(f"未找到{JPEGTRAN_NAME}，JPEG无损区域模式不可用，将重新编码整幅图片。"
+                      f"请安装libjpeg-turbo（提供{JPEGTRAN_NAME}）后重试")
+            elif not _supports_drop(jpegtran):
+                print(f"{jpegtran} 不支持 -drop，JPEG无损区域模式不可用，将重新编码整幅图片。"
+                      f"请安装libjpeg-turbo 2.1或更高版本（或IJG libjpeg 9以上）后重试")
+            else:
+                _jpegtran_path = jpegtran
+        return _jpegtran_path
+
+
+def _run_jpegtran(args, data):
+    jpegtran = find_jpegtran()
+    if jpegtran is None:
+        raise JpegRegionError(f"未找到{JPEGTRAN_NAME}")
+    try:
+        result = subprocess.run([jpegtran] + args, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                timeout=JPEGTRAN_TIMEOUT, creationflags=_CREATE_NO_WINDOW)
+    except (OSError, subprocess.SubprocessError) as e:
+        raise JpegRegionError(f"调用{JPEGTRAN_NAME}失败: {e}")
+    if result.returncode != 0 or not result.stdout:
+        message = result.stderr.decode('utf-8', 'replace').strip()
+        raise JpegRegionError(f"{JPEGTRAN_NAME}出错: {message or result.returncode}")
+    return result.stdout
+
+
+def get_mcu_size(img):
+    """
+    返回JPEG图片的MCU尺寸（像素），即最大采样因子乘以8，如4:2:0为16x16、4:4:4为8x8
+    """
+    return (8 * max(layer[1] for layer in img.layer),
+            8 * max(layer[2] for layer in img.layer))
+
+
+def get_mcu_region(size, mcu_size, box):
+    """
+    将区域 box (left, top, right, bottom) 限制在图片内并向外扩展到MCU边界，
+    区域完全位于图片之外时返回None
+    """
+    width, height = size
+    mcu_width, mcu_height = mcu_size
+    left, top = max(0, box[0]), max(0, box[1])
+    right, bottom = min(width, box[2]), min(height, box[3])
+    if left >= right or top >= bottom:
+        return None
+    left -= left % mcu_width
+    top -= top % mcu_height
+    right = min(width, -(-right // mcu_width) * mcu_width)
+    bottom = min(height, -(-bottom // mcu_height) * mcu_height)
+    return left, top, right, bottom
+
+
+def recompress_region(data, stamp, position, optimize=False, progressive=False):
+    """
+    在JPEG图片（data 为文件内容）上合成水印图块，只重新编码水印覆盖的MCU：
+    用jpegtran无损裁剪出覆盖水印的MCU区域，解码该区域并合成水印后按原图的量化表和色度抽样编码，
+    再用jpegtran插入原图。其余MCU的DCT系数原样保留，不会因再次压缩损失画质（该模式不用于加快导出）。
+    水印区域只能使用原图的量化表，输出质量设置不起作用。
+    与整幅图片导出一致，不保留EXIF等元数据。返回新的JPEG文件内容，无法处理时抛出 JpegRegionError
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        if img.format != 'JPEG' or img.mode != 'RGB':
+            raise JpegRegionError(f"只支持YCbCr彩色JPEG图片（当前为 {img.format} {img.mode}）")
+        size = img.size
+        mcu_size = get_mcu_size(img)
+
+    options = ['-copy', 'none']
+    if optimize:
+        options.append('-optimize')
+    if progressive:
+        options.append('-progressive')
+
+    x, y = position
+    region = get_mcu_region(size, mcu_size, (x, y, x + stamp.width, y + stamp.height))
+    if region is None:
+        # 水印完全位于图片之外，只去除元数据
+        return _run_jpegtran(options, data)
+    left, top, right, bottom = region
+
+    # 无损裁剪出的区域与原图使用相同的量化表和色度抽样
+    cropped = _run_jpegtran(['-copy', 'none', '-crop', f'{right - left}x{bottom - top}+{left}+{top}'], data)
+    with Image.open(io.BytesIO(cropped)) as patch:
+        qtables = patch.quantization
+        subsampling = JpegImagePlugin.get_sampling(patch)
+        if subsampling == -1 or patch.size != (right - left, bottom - top):
+            raise JpegRegionError("不支持的色度抽样方式")
+        patch.load()
+        patch_img = patch.copy()
+
+    composite_stamp(patch_img, stamp, (x - left, y - top))
+    patch_buffer = io.BytesIO()
+    patch_img.save(patch_buffer, format='JPEG', qtables=qtables, subsampling=subsampling)
+
+    # jpegtran 的 -drop 只能从文件读取插入的图块
+    fd, patch_path = tempfile.mkstemp(suffix='.jpg')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(patch_buffer.getvalue())
+        return _run_jpegtran(options + ['-drop', f'+{left}+{top}', patch_path], data)
+    finally:
+        try:
+            os.remove(patch_path)
+        except OSError:
+            pass
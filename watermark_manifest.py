@@ -0,0 +1,99 @@
+import os
+import json
+import hashlib
+import threading
+
+
+# 增量处理清单文件名（保存在输出目录中）
+MANIFEST_FILENAME = '.watermark_manifest.jsonl'
+
+
+def settings_digest(settings):
+    """
+    计算水印设置的哈希值，任何影响输出结果的设置变化都会得到不同的值
+    """
+    data = json.dumps(settings, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class BatchManifest:
+    """
+    增量处理清单：记录每张输入图片的文件指纹（大小、修改时间）和处理时使用的设置哈希。
+    每处理完一张图片就追加一行记录，中断后再次运行时已完成的图片会被跳过。
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry['input']] = entry
+                    except (ValueError, KeyError, TypeError):
+                        # 中断时可能留下不完整的最后一行
+                        continue
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"读取增量处理清单时出错 {self.path}: {e}")
+
+    def is_up_to_date(self, input_path, output_path, digest, stat_result=None):
+        """
+        判断输入图片是否已经用相同设置处理过，且输出文件仍然存在
+        """
+        entry = self.entries.get(os.path.abspath(input_path))
+        if entry is None:
+            return False
+        if stat_result is None:
+            try:
+                stat_result = os.stat(input_path)
+            except OSError:
+                return False
+        return (entry.get('size') == stat_result.st_size
+                and entry.get('mtime_ns') == stat_result.st_mtime_ns
+                and entry.get('settings') == digest
+                and entry.get('output') == os.path.basename(output_path)
+                and os.path.exists(output_path))
+
+    def record(self, input_path, output_path, digest, stat_result):
+        """
+        记录一张处理成功的图片，stat_result 应为处理前获取的输入文件状态
+        """
+        entry = {
+            'input': os.path.abspath(input_path),
+            'size': stat_result.st_size,
+            'mtime_ns': stat_result.st_mtime_ns,
+            'settings': digest,
+            'output': os.path.basename(output_path),
+        }
+        with self._lock:
+            self.entries[entry['input']] = entry
+            try:
+                os.makedirs(self.output_dir, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            except OSError as e:
+                print(f"写入增量处理清单时出错 {self.path}: {e}")
+
+    def compact(self):
+        """
+        重写清单文件，去掉同一输入图片的重复记录
+        """
+        if not os.path.isdir(self.output_dir):
+            return
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for entry in self.entries.values():
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"整理增量处理清单时出错 {self.path}: {e}")
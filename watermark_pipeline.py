@@ -0,0 +1,99 @@
+import queue
+import threading
+
+
+# 通知工作线程退出的标记
+_STOP = object()
+
+
+class StagePipeline:
+    """
+    多阶段流水线：每个阶段有独立数量的工作线程，相邻阶段之间用有界队列连接。
+    下游阶段处理不过来时上游阶段会在队列上阻塞（背压），使内存中的任务数保持有界，
+    磁盘读写等待和CPU计算可以同时进行。
+
+    stages 为 [(阶段名, 处理函数, 线程数)]，处理函数 func(key, value) 返回交给下一阶段的value。
+    所有方法都应在同一个（调用方）线程中调用。
+    """
+
+    def __init__(self, stages, queue_size):
+        self._stages = [(name, func, max(1, workers)) for name, func, workers in stages]
+        self._queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in self._stages]
+        # 完成的任务：(key, 是否成功)，不设上限，避免调用方提交任务时与工作线程互相等待
+        self._results = queue.Queue()
+        self._running = [workers for _, _, workers in self._stages]
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._closed = False
+
+        self._threads = []
+        for index, (name, _, workers) in enumerate(self._stages):
+            for i in range(workers):
+                thread = threading.Thread(target=self._worker, args=(index,), name=f"{name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self, index):
+        name, func, _ = self._stages[index]
+        input_queue = self._queues[index]
+        is_last = index + 1 == len(self._stages)
+        while True:
+            item = input_queue.get()
+            if item is _STOP:
+                break
+            key, value = item
+            try:
+                value = func(key, value)
+            except Exception as e:
+                print(f"处理图片时出错 {key} (阶段 {name}): {e}")
+                self._results.put((key, False))
+                continue
+            if is_last:
+                self._results.put((key, True))
+            else:
+                self._queues[index + 1].put((key, value))
+
+        # 本阶段最后一个退出的线程通知下一阶段的所有线程退出
+        with self._lock:
+            self._running[index] -= 1
+            last_worker = self._running[index] == 0
+        if last_worker and not is_last:
+            for _ in range(self._stages[index + 1][2]):
+                self._queues[index + 1].put(_STOP)
+
+    def submit(self, key, value=None):
+        """
+        提交一个任务到第一个阶段，第一个阶段的队列已满时阻塞
+        """
+        if self._closed:
+            raise RuntimeError("流水线已关闭")
+        self._pending += 1
+        self._queues[0].put((key, value))
+
+    def completed(self, block=False):
+        """
+        依次返回已完成的任务 (key, 是否成功)。
+        block 为False时只返回当前已完成的任务；为True时一直等到所有已提交的任务完成
+        """
+        while self._pending:
+            try:
+                result = self._results.get(block=block)
+            except queue.Empty:
+                return
+            self._pending -= 1
+            yield result
+
+    def close(self):
+        """
+        不再提交新任务，已提交的任务处理完后工作线程退出
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for _ in range(self._stages[0][2]):
+            self._queues[0].put(_STOP)
+
+    def join(self):
+        self.close()
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,83 @@
+import os
+from collections import OrderedDict, namedtuple
+
+
+# 预览缓存的默认内存上限（字节）
+PREVIEW_CACHE_BUDGET = 256 * 1024 * 1024
+
+# 每个像素在缓存中占用的字节数估计：缩放后的PIL图片（RGB/RGBA）加上Tk中的PhotoImage（按4字节计）
+_BYTES_PER_PIXEL = 8
+
+# 一张图片在预览画布中的缓存：
+# image 为按画布尺寸缩放后的图片，photo 为对应的 ImageTk.PhotoImage，
+# ratio 为缩放比例，orig_size 为原图尺寸，date 为已解析的水印日期
+PreviewProxy = namedtuple('PreviewProxy', ['image', 'photo', 'ratio', 'orig_size', 'date'])
+
+
+def _file_signature(image_path, stat_result=None):
+    if stat_result is None:
+        try:
+            stat_result = os.stat(image_path)
+        except OSError:
+            return None
+    return stat_result.st_size, stat_result.st_mtime_ns
+
+
+class PreviewCache:
+    """
+    按图片缓存预览代理（缩放后的图片、PhotoImage和水印日期），总内存超出上限时淘汰最久未使用的条目。
+    条目与画布尺寸绑定，画布尺寸变化后自动失效；文件状态只在 validate 时检查（如选中图片时），
+    渲染每一帧时不访问文件系统。
+    只应在界面线程中使用。
+    """
+
+    def __init__(self, max_bytes=PREVIEW_CACHE_BUDGET):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # 图片路径 -> (画布尺寸, 文件签名, 预览代理, 占用字节数)，按最近使用顺序排列
+        self._entries = OrderedDict()
+
+    def get(self, image_path, canvas_size):
+        """
+        返回图片在指定画布尺寸下的预览代理，没有有效缓存时返回None。不检查文件状态，见 validate
+        """
+        entry = self._entries.get(image_path)
+        if entry is None:
+            return None
+        if entry[0] != canvas_size:
+            self.discard(image_path)
+            return None
+        self._entries.move_to_end(image_path)
+        return entry[2]
+
+    def put(self, image_path, canvas_size, proxy, stat_result=None):
+        """
+        保存预览代理，超出内存上限时淘汰最久未使用的条目（刚保存的条目总是保留）。
+        stat_result 为读取图片时得到的stat结果，为None时重新获取
+        """
+        self.discard(image_path)
+        width, height = proxy.image.size
+        nbytes = width * height * _BYTES_PER_PIXEL
+        self._entries[image_path] = (canvas_size, _file_signature(image_path, stat_result), proxy, nbytes)
+        self.total_bytes += nbytes
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, _, _, evicted_bytes) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_bytes
+        return proxy
+
+    def validate(self, image_path):
+        """
+        检查缓存条目对应的文件是否被修改，被修改或无法访问时丢弃条目
+        """
+        entry = self._entries.get(image_path)
+        if entry is not None and entry[1] != _file_signature(image_path):
+            self.discard(image_path)
+
+    def discard(self, image_path):
+        entry = self._entries.pop(image_path, None)
+        if entry is not None:
+            self.total_bytes -= entry[3]
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
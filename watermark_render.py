@@ -0,0 +1,139 @@
+import math
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+from watermark_fonts import get_font
+
+
+# 水印图块缓存的最大条目数
+STAMP_CACHE_SIZE = 128
+
+
+def render_watermark_stamp(text, font, text_rgba, stroke=None, shadow=None):
+    """
+    将水印文本（含描边和阴影）渲染到刚好容纳它的透明RGBA图块上。
+    stroke 为 (描边宽度, 描边颜色RGBA) 或None，shadow 为 (阴影偏移, 阴影颜色RGBA) 或None。
+    返回 (图块, (偏移x, 偏移y))：把图块贴到文本绘制位置加上偏移处，
+    效果与直接在该位置绘制文本相同。
+    """
+    text_bbox = font.getbbox(text)
+    left, top, right, bottom = text_bbox
+
+    # 描边向四周扩展，阴影整体平移
+    if stroke:
+        stroke_width = stroke[0]
+        left, top = left - stroke_width, top - stroke_width
+        right, bottom = right + stroke_width, bottom + stroke_width
+    if shadow:
+        shadow_offset = shadow[0]
+        left = min(left, text_bbox[0] + shadow_offset)
+        top = min(top, text_bbox[1] + shadow_offset)
+        right = max(right, text_bbox[2] + shadow_offset)
+        bottom = max(bottom, text_bbox[3] + shadow_offset)
+
+    left, top = math.floor(left), math.floor(top)
+    right, bottom = math.ceil(right), math.ceil(bottom)
+    stamp = Image.new('RGBA', (max(1, right - left), max(1, bottom - top)), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(stamp)
+    x, y = -left, -top
+
+    # 先绘制描边（如果启用），一次绘制完成，耗时与描边宽度基本无关
+    if stroke:
+        stroke_width, stroke_rgba = stroke
+        if isinstance(font, ImageFont.FreeTypeFont):
+            # 由FreeType生成向外扩展 stroke_width 的文本轮廓
+            draw.text((x, y), text, font=font, fill=stroke_rgba, stroke_width=stroke_width)
+        else:
+            # 位图字体不支持描边，对文本蒙版做一次膨胀得到描边区域
+            mask = Image.new('L', stamp.size, 0)
+            ImageDraw.Draw(mask).text((x, y), text, font=font, fill=255)
+            mask = mask.filter(ImageFilter.MaxFilter(2 * stroke_width + 1))
+            draw.bitmap((0, 0), mask, fill=stroke_rgba)
+
+    # 再绘制阴影（如果启用）
+    if shadow:
+        shadow_offset, shadow_rgba = shadow
+        draw.text((x + shadow_offset, y + shadow_offset), text, font=font, fill=shadow_rgba)
+
+    # 最后绘制主要文本
+    draw.text((x, y), text, font=font, fill=text_rgba)
+
+    return stamp, (left, top)
+
+
+@lru_cache(maxsize=STAMP_CACHE_SIZE)
+def get_watermark_stamp(text, font_name, font_size, text_rgba, stroke=None, shadow=None, bold=False, italic=False):
+    """
+    获取缓存的水印图块，按 (文本, 字体, 字号, 颜色及透明度, 描边, 阴影, 粗体, 斜体) 缓存。
+    颜色参数为已应用透明度的RGBA元组。返回的图块被多张图片共享，调用方不能修改。
+    """
+    font = get_font(font_name, font_size, bold, italic)
+    return render_watermark_stamp(text, font, text_rgba, stroke, shadow)
+
+
+def normalize_image_mode(img):
+    """
+    将图片转换为可直接合成水印的模式：RGB和RGBA保持不变，
+    带透明度的其他模式转换为RGBA，其余模式转换为RGB
+    """
+    if img.mode in ('RGB', 'RGBA'):
+        return img
+    if img.mode in ('LA', 'PA', 'La', 'RGBa') or 'transparency' in img.info:
+        return img.convert('RGBA')
+    return img.convert('RGB')
+
+
+def composite_stamp(img, stamp, position):
+    """
+    只在水印图块覆盖的区域内进行透明度合成，原图保持原有模式并被原地修改。
+    图片应为RGB或RGBA模式（见 normalize_image_mode），position 为图块左上角坐标。
+    """
+    x, y = position
+    left, top = max(0, x), max(0, y)
+    right, bottom = min(img.width, x + stamp.width), min(img.height, y + stamp.height)
+    if left >= right or top >= bottom:
+        # 水印完全位于图片之外
+        return img
+
+    tile = stamp.crop((left - x, top - y, right - x, bottom - y))
+    region = img.crop((left, top, right, bottom))
+    if region.mode != 'RGBA':
+        region = Image.alpha_composite(region.convert('RGBA'), tile).convert(img.mode)
+    else:
+        region = Image.alpha_composite(region, tile)
+    img.paste(region, (left, top))
+    return img
+
+
+def get_target_size(width, height, resize_method, target_width=None, target_height=None, scale_percent=100):
+    """
+    根据缩放方式计算目标尺寸，不需要缩放时返回None
+    resize_method: 'width' 按宽度缩放，'height' 按高度缩放，'percent' 按百分比缩放，其他值保持原图大小
+    """
+    if resize_method == 'width':
+        # 按宽度缩放
+        target_width = int(target_width)
+        return target_width, int(height * target_width / width)
+    if resize_method == 'height':
+        # 按高度缩放
+        target_height = int(target_height)
+        return int(width * target_height / height), target_height
+    if resize_method == 'percent':
+        # 按百分比缩放
+        return int(width * scale_percent / 100), int(height * scale_percent / 100)
+    return None
+
+
+def load_resized_image(img, target_size):
+    """
+    将刚打开（尚未解码）的图片缩放到目标尺寸。
+    JPEG缩小到一半及以下时，先通过 draft 让libjpeg在解码时直接按1/2、1/4或1/8进行DCT缩放，
+    其他情况先用 reduce 按整数倍缩小，最后再用LANCZOS重采样到精确尺寸。
+    """
+    target_width, target_height = target_size
+    if img.format == 'JPEG' and target_width * 2 <= img.width and target_height * 2 <= img.height:
+        # draft 选择解码后仍不小于目标尺寸的最大缩放比例，必须在图片加载前调用
+        img.draft(img.mode, target_size)
+    if img.size == target_size:
+        return img
+    # reducing_gap 使Pillow先按整数倍 reduce，再对剩余部分进行LANCZOS重采样
+    return img.resize(target_size, Image.LANCZOS, reducing_gap=2.0)
@@ -0,0 +1,208 @@
+import hashlib
+import io
+import os
+import pathlib
+import struct
+import threading
+from PIL import Image, PngImagePlugin
+from watermark_cache import USER_CACHE_DIR
+from watermark_exif import ExifFormatError, find_exif_thumbnail
+
+
+# 图片列表中缩略图的最大尺寸
+THUMBNAIL_SIZE = (100, 100)
+
+# 缩略图占位图的颜色（缩略图生成完成前显示）
+PLACEHOLDER_COLOR = (224, 224, 224)
+
+# 默认的缩略图缓存目录，按缩略图尺寸分子目录
+DEFAULT_THUMBNAIL_DIR = os.path.join(USER_CACHE_DIR, 'thumbnails')
+
+# 缩略图缓存的磁盘空间上限（字节），超出后删除最久未使用的缩略图，直到低于上限的 THUMBNAIL_CACHE_PRUNE_RATIO
+THUMBNAIL_CACHE_LIMIT = 256 * 1024 * 1024
+THUMBNAIL_CACHE_PRUNE_RATIO = 0.8
+
+# EXIF嵌入缩略图与原图宽高比允许的相对误差，超出时认为缩略图有黑边或未随原图旋转
+EMBEDDED_ASPECT_TOLERANCE = 0.02
+
+
+def _load_embedded_thumbnail(fp, size):
+    """
+    使用EXIF中嵌入的JPEG缩略图，没有可用的嵌入缩略图时返回None。
+    嵌入缩略图比需要的尺寸小，或宽高比与原图不一致（加了黑边、原图旋转后未更新缩略图）时不使用
+    """
+    try:
+        data = find_exif_thumbnail(fp)
+    except (ExifFormatError, struct.error):
+        return None
+    if data is None:
+        return None
+    fp.seek(0)
+    # Image.open 只解析文件头，得到原图尺寸
+    with Image.open(fp) as img:
+        width, height = img.size
+    try:
+        with Image.open(io.BytesIO(data)) as embedded:
+            embedded_width, embedded_height = embedded.size
+            aspect = width / height
+            if abs(embedded_width / embedded_height - aspect) > aspect * EMBEDDED_ASPECT_TOLERANCE:
+                return None
+            scale = min(size[0] / width, size[1] / height)
+            if embedded_width < width * scale - 1 or embedded_height < height * scale - 1:
+                return None
+            embedded.thumbnail(size)
+            return embedded.convert('RGB')
+    except (IOError, OSError, SyntaxError):
+        return None
+
+
+def make_thumbnail(image_path, size=THUMBNAIL_SIZE):
+    """
+    生成图片缩略图（保持比例，不超过 size），可在后台线程中调用。
+    优先使用EXIF中嵌入的缩略图，只需读取几KB；否则解码原图，
+    JPEG通过 draft 直接以1/2到1/8的比例解码，不需要解码整幅原图
+    """
+    with open(image_path, 'rb') as f:
+        thumbnail = _load_embedded_thumbnail(f, size)
+        if thumbnail is not None:
+            return thumbnail
+        f.seek(0)
+        with Image.open(f) as img:
+            img.draft('RGB', size)
+            img.thumbnail(size)
+            # 关闭文件时会释放原图对象的数据，返回副本
+            if img.mode in ('RGB', 'RGBA', 'L', 'LA'):
+                return img.copy()
+            return img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+
+
+def make_placeholder(size=THUMBNAIL_SIZE):
+    """
+    生成缩略图占位图
+    """
+    return Image.new('RGB', size, PLACEHOLDER_COLOR)
+
+
+class ThumbnailCache:
+    """
+    磁盘缩略图缓存，参照freedesktop缩略图规范：
+    文件名为原图URI的MD5，PNG的文本块中记录原图的URI、修改时间和大小，原图变化后缓存自动失效。
+    命中时更新缩略图文件的修改时间，总大小超出上限时按修改时间删除最久未使用的缩略图。
+    可在多个线程中同时使用。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_THUMBNAIL_DIR, size=THUMBNAIL_SIZE, max_bytes=THUMBNAIL_CACHE_LIMIT):
+        self.size = size
+        self.cache_dir = os.path.join(cache_dir, f'{size[0]}x{size[1]}')
+        self.max_bytes = max_bytes
+        self.enabled = True
+        self._lock = threading.Lock()
+        # 缓存目录的总大小，第一次写入时扫描目录得到
+        self._total_bytes = None
+
+    def _disable(self, error):
+        # 缓存目录不可用（如只读）时直接生成缩略图
+        if self.enabled:
+            print(f"缩略图缓存不可用，将直接生成缩略图: {error}")
+        self.enabled = False
+
+    def _thumbnail_path(self, uri):
+        return os.path.join(self.cache_dir, hashlib.md5(uri.encode('utf-8')).hexdigest() + '.png')
+
+    def load(self, image_path):
+        """
+        返回图片的缩略图：缓存有效时从磁盘读取，否则生成缩略图并写入缓存
+        """
+        if not self.enabled:
+            return make_thumbnail(image_path, self.size)
+
+        image_path = os.path.abspath(image_path)
+        stat_result = os.stat(image_path)
+        uri = pathlib.Path(image_path).as_uri()
+        thumbnail_path = self._thumbnail_path(uri)
+
+        thumbnail = self._read(thumbnail_path, uri, stat_result)
+        if thumbnail is not None:
+            return thumbnail
+
+        thumbnail = make_thumbnail(image_path, self.size)
+        self._write(thumbnail_path, thumbnail, uri, stat_result)
+        return thumbnail
+
+    def _read(self, thumbnail_path, uri, stat_result):
+        try:
+            with Image.open(thumbnail_path) as img:
+                info = img.text
+                if (info.get('Thumb::URI') != uri
+                        or info.get('Thumb::MTime') != str(int(stat_result.st_mtime))
+                        or info.get('Thumb::Size') != str(stat_result.st_size)):
+                    return None
+                thumbnail = img.copy()
+            # 更新修改时间，清理时按最近使用顺序淘汰
+            os.utime(thumbnail_path)
+            return thumbnail
+        except FileNotFoundError:
+            return None
+        except (IOError, OSError, SyntaxError) as e:
+            # 缩略图文件损坏，重新生成后覆盖
+            print(f"读取缓存的缩略图时出错 {thumbnail_path}: {e}")
+            return None
+
+    def _write(self, thumbnail_path, thumbnail, uri, stat_result):
+        info = PngImagePlugin.PngInfo()
+        info.add_text('Thumb::URI', uri)
+        info.add_text('Thumb::MTime', str(int(stat_result.st_mtime)))
+        info.add_text('Thumb::Size', str(stat_result.st_size))
+        # 先写入临时文件再替换，其他线程不会读到写了一半的缩略图
+        temp_path = f'{thumbnail_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            old_size = os.path.getsize(thumbnail_path) if os.path.exists(thumbnail_path) else 0
+            thumbnail.save(temp_path, 'PNG', pnginfo=info)
+            new_size = os.path.getsize(temp_path)
+            os.replace(temp_path, thumbnail_path)
+        except OSError as e:
+            self._disable(e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        self._account(new_size - old_size)
+
+    def _account(self, delta):
+        with self._lock:
+            if self._total_bytes is None:
+                # 扫描结果已包含刚写入的文件
+                self._total_bytes = sum(size for _, _, size in self._scan())
+            else:
+                self._total_bytes += delta
+            if self._total_bytes > self.max_bytes:
+                self._prune()
+
+    def _scan(self):
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith('.png'):
+                        stat_result = entry.stat()
+                        entries.append((stat_result.st_mtime, entry.path, stat_result.st_size))
+        except OSError:
+            pass
+        return entries
+
+    def _prune(self):
+        # 按修改时间（最近使用时间）从旧到新删除，直到低于上限的一定比例
+        target = self.max_bytes * THUMBNAIL_CACHE_PRUNE_RATIO
+        entries = sorted(self._scan())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total_bytes = total